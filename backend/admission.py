@@ -0,0 +1,219 @@
+import asyncio
+import collections
+import logging
+import os
+import shutil
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+
+from metrics import ADMISSION_DECISIONS, ADMISSION_INFLIGHT, ADMISSION_PRESSURE, QUEUE_DEPTH
+from storage import scratch
+
+logger = logging.getLogger(__name__)
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Heavy lane: downloads, batch items, prefetches and resumed jobs, each holding
+# an executor thread for its whole run.
+ADMISSION_MAX_DOWNLOADS = int(os.environ.get("ADMISSION_MAX_DOWNLOADS", max(2, CPU_COUNT)))
+ADMISSION_DOWNLOAD_QUEUE = int(os.environ.get("ADMISSION_DOWNLOAD_QUEUE", 2 * ADMISSION_MAX_DOWNLOADS))
+ADMISSION_DOWNLOAD_WAIT = float(os.environ.get("ADMISSION_DOWNLOAD_WAIT", 10))
+# Light lane: info lookups. Never shed for load, only bounded.
+ADMISSION_MAX_INFO = int(os.environ.get("ADMISSION_MAX_INFO", 16))
+ADMISSION_INFO_QUEUE = int(os.environ.get("ADMISSION_INFO_QUEUE", 64))
+ADMISSION_INFO_WAIT = float(os.environ.get("ADMISSION_INFO_WAIT", 20))
+# Heavy work is shed above this 1-minute load average per CPU ...
+ADMISSION_MAX_LOAD = float(os.environ.get("ADMISSION_MAX_LOAD", 2.0))
+# ... or once scratch usage passes this fraction of its global quota.
+ADMISSION_MAX_SCRATCH_RATIO = float(os.environ.get("ADMISSION_MAX_SCRATCH_RATIO", 0.9))
+ADMISSION_SAMPLE_INTERVAL = float(os.environ.get("ADMISSION_SAMPLE_INTERVAL", 5))
+# Threads for the default executor: one per admitted download and info lookup,
+# plus headroom for short tasks (file reads, sampling, previews), so admitted
+# work never waits for a thread. Python's own default is min(32, cpus + 4).
+EXECUTOR_THREADS = int(os.environ.get("EXECUTOR_THREADS", ADMISSION_MAX_DOWNLOADS + ADMISSION_MAX_INFO + 8))
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted; `retry_after` is in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def overloaded_response(error: Overloaded) -> JSONResponse:
+    """503 telling the client when to try again."""
+    logger.warning(f"Shedding request: {error.reason}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please try again shortly"},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+class Lane:
+    """A bounded number of running jobs plus a bounded FIFO of waiting ones."""
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait: float, sheddable: bool, retry_after: int):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.sheddable = sheddable
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.waiters = collections.deque()
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= self.limit and len(self.waiters) >= self.queue_size
+
+    def _publish(self):
+        ADMISSION_INFLIGHT.labels(lane=self.name).set(self.in_flight)
+        QUEUE_DEPTH.labels(queue=f'admission-{self.name}').set(len(self.waiters))
+
+    def _reject(self, reason: str):
+        ADMISSION_DECISIONS.labels(lane=self.name, decision='rejected').inc()
+        raise Overloaded(reason, self.retry_after)
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free right now, without queueing."""
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            ADMISSION_DECISIONS.labels(lane=self.name, decision='admitted').inc()
+            self._publish()
+            return True
+        return False
+
+    async def acquire(self):
+        if self.try_acquire():
+            return
+        if len(self.waiters) >= self.queue_size:
+            self._reject(f"{self.name} queue is full")
+
+        # release() hands its slot straight to the first waiter, so in_flight
+        # doesn't change when a queued job starts.
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters.append(waiter)
+        ADMISSION_DECISIONS.labels(lane=self.name, decision='queued').inc()
+        self._publish()
+        try:
+            await asyncio.wait({waiter}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self._publish()
+        if waiter.cancelled():
+            self._reject(f"Timed out waiting for a {self.name} slot")
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._publish()
+                return
+        self.in_flight -= 1
+        self._publish()
+
+
+class AdmissionController:
+    """Decide whether work may start now, later, or not at all.
+
+    Progress polling is never gated. Info lookups have their own lane, so
+    they don't queue behind downloads. Downloads are additionally shed while
+    the machine is overloaded or scratch space is nearly exhausted.
+    """
+
+    def __init__(self):
+        self.lanes = {
+            'download': Lane('download', ADMISSION_MAX_DOWNLOADS, ADMISSION_DOWNLOAD_QUEUE,
+                             ADMISSION_DOWNLOAD_WAIT, sheddable=True, retry_after=30),
+            'info': Lane('info', ADMISSION_MAX_INFO, ADMISSION_INFO_QUEUE,
+                         ADMISSION_INFO_WAIT, sheddable=False, retry_after=5),
+        }
+        self.load_per_cpu = 0.0
+        self.scratch_ratio = 0.0
+        self.disk_low = False
+
+    def pressure(self) -> Optional[str]:
+        """Why heavy work should be shed right now, or None."""
+        if self.load_per_cpu > ADMISSION_MAX_LOAD:
+            return f"CPU load {self.load_per_cpu:.1f} per core"
+        if self.scratch_ratio > ADMISSION_MAX_SCRATCH_RATIO:
+            return f"scratch storage {self.scratch_ratio:.0%} full"
+        if self.disk_low:
+            return "scratch disk is nearly full"
+        return None
+
+    def check(self, lane_name: str):
+        """Reject without waiting if `lane_name` would not take more work."""
+        lane = self.lanes[lane_name]
+        reason = self.pressure() if lane.sheddable else None
+        if reason is None and lane.saturated:
+            reason = f"{lane.name} queue is full"
+        if reason is not None:
+            lane._reject(reason)
+
+    def has_capacity(self, lane_name: str) -> bool:
+        """Whether a job would start immediately; used for optional work like prefetching."""
+        lane = self.lanes[lane_name]
+        return lane.in_flight < lane.limit and not lane.waiters and not (lane.sheddable and self.pressure())
+
+    def try_admit(self, lane_name: str) -> bool:
+        """Take a slot only if a job would start immediately; pair with release()."""
+        lane = self.lanes[lane_name]
+        if lane.sheddable and self.pressure():
+            return False
+        return lane.try_acquire()
+
+    def release(self, lane_name: str):
+        self.lanes[lane_name].release()
+
+    @asynccontextmanager
+    async def admit(self, lane_name: str):
+        """Hold a slot in `lane_name` for the duration of the block, queueing if needed."""
+        lane = self.lanes[lane_name]
+        if lane.sheddable:
+            reason = self.pressure()
+            if reason is not None:
+                lane._reject(reason)
+        await lane.acquire()
+        try:
+            yield
+        finally:
+            lane.release()
+
+    def sample(self):
+        """Refresh the load and disk signals (blocking; walks the scratch tree)."""
+        if hasattr(os, 'getloadavg'):
+            self.load_per_cpu = os.getloadavg()[0] / CPU_COUNT
+        self.scratch_ratio = scratch.used_bytes() / scratch.global_quota if scratch.global_quota else 0.0
+        try:
+            self.disk_low = shutil.disk_usage(scratch.disk_root).free < scratch.min_free * 2
+        except FileNotFoundError:
+            self.disk_low = False
+        ADMISSION_PRESSURE.labels(signal='load_per_cpu').set(self.load_per_cpu)
+        ADMISSION_PRESSURE.labels(signal='scratch_ratio').set(self.scratch_ratio)
+        ADMISSION_PRESSURE.labels(signal='disk_low').set(1 if self.disk_low else 0)
+
+    async def run_sampler(self, interval: float = ADMISSION_SAMPLE_INTERVAL):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.sample)
+            except Exception as e:
+                logger.error(f"Admission sampling failed: {str(e)}")
+            await asyncio.sleep(interval)
+
+
+admission = AdmissionController()
@@ -0,0 +1,222 @@
+import asyncio
+import io
+import logging
+import os
+import time
+import zipfile
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from admission import Overloaded, admission, overloaded_response
+from cancellation import CancelToken
+from deps import yt_dlp
+from egress import client_key, egress
+from logging_config import truncate
+from metrics import QUEUE_DEPTH
+from negative_cache import negative_cache, video_key
+from platforms import is_allowed_url, platforms
+from results import StoredResult, content_disposition, result_key, results, safe_filename
+
+logger = logging.getLogger(__name__)
+ytdlp_logger = logging.getLogger('yt_dlp')
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 3))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 50))
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+router = APIRouter()
+
+
+class BatchRequest(BaseModel):
+    urls: List[str] = []
+    playlist: Optional[str] = None
+    quality: int = 720
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable file object collecting what zipfile writes, so it can be streamed.
+
+    zipfile detects that it can't seek and writes data descriptors after each
+    member instead of patching local headers, so the archive never has to be
+    held in memory or on disk as a whole.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def expand_playlist(url: str, limit: int) -> List[str]:
+    """Resolve a playlist URL into the URLs of its entries without extracting each one."""
+    opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'playlistend': limit,
+        'logger': ytdlp_logger
+    }
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if not info:
+        raise ValueError("Could not extract playlist information")
+    entries = info.get('entries') or [info]
+    urls = [entry.get('url') or entry.get('webpage_url') for entry in entries if entry]
+    return [u for u in urls if u][:limit]
+
+
+def download_item(url: str, quality: int, token: CancelToken) -> StoredResult:
+    """Download one batch item through the same pipeline as a single download.
+
+    Items share the platform handlers, the result store and the negative
+    cache with /api/download, so a video already fetched by either is reused.
+    """
+    # main imports this module for its router, so the pipeline is looked up on first use
+    from main import generate_download_id, run_download_job
+
+    handler = platforms.detect(url)
+    platform = handler.name if handler else 'generic'
+    # Same key as POST /api/download for this URL and quality
+    cache_key = result_key(url, platform, quality)
+    stored = results.lookup(cache_key)
+    if stored is not None:
+        return stored
+    negative_cache.check(url)
+    token.check()
+    return run_download_job(
+        url, platform, quality, 'video', None, None, None, generate_download_id(url), cache_key, token,
+        endpoint='/api/batch'
+    )
+
+
+async def stream_batch(urls: List[str], quality: int):
+    """Download items in parallel and yield a ZIP archive as each one finishes."""
+    # The same video listed twice, under any of its URLs, is downloaded and archived once
+    unique = {}
+    for url in urls:
+        unique.setdefault(video_key(url), url)
+    urls = list(unique.values())
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    finished = asyncio.Queue()
+    queue_depth = QUEUE_DEPTH.labels(queue='batch')
+    # Closing the stream (e.g. the client went away) cancels every item still running
+    tokens = [CancelToken() for _ in urls]
+
+    async def run_item(index: int, url: str):
+        waiting = True
+        queue_depth.inc()
+        try:
+            async with semaphore:
+                queue_depth.dec()
+                waiting = False
+                # Each item counts against the download lane like a single download
+                async with admission.admit('download'):
+                    # Scratch space is allocated and released by the download job itself
+                    stored = await loop.run_in_executor(None, download_item, url, quality, tokens[index])
+                # Open it now: items are archived one at a time at the client's pace, and the
+                # stored result may expire or be pruned before its turn comes.
+                source = await loop.run_in_executor(None, open, stored.path, 'rb')
+                await finished.put((url, stored, source, None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await finished.put((url, None, None, e))
+        finally:
+            if waiting:
+                queue_depth.dec()
+
+    tasks = [asyncio.ensure_future(run_item(i, url)) for i, url in enumerate(urls)]
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True)
+    used_names = set()
+    failures = []
+    try:
+        for _ in range(len(tasks)):
+            url, stored, source, error = await finished.get()
+            if error is not None:
+                logger.warning(f"Batch item failed for {url}: {truncate(str(error))}")
+                failures.append(f"{url}\t{str(error)}")
+                continue
+
+            name = safe_filename(stored.filename)
+            stem, suffix = os.path.splitext(name)
+            counter = 1
+            while name in used_names:
+                counter += 1
+                name = f"{stem} ({counter}){suffix}"
+            used_names.add(name)
+
+            member = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            with source, archive.open(member, mode='w', force_zip64=True) as dest:
+                while True:
+                    chunk = await loop.run_in_executor(None, source.read, ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            # The member's data descriptor is written when it is closed
+            yield sink.drain()
+
+        if failures:
+            archive.writestr('errors.txt', "\n".join(failures) + "\n")
+        archive.close()
+        yield sink.drain()
+    finally:
+        for token in tokens:
+            token.cancel("batch stream closed")
+        for task in tasks:
+            task.cancel()
+        while not finished.empty():
+            source = finished.get_nowait()[2]
+            if source is not None:
+                source.close()
+
+
+@router.post("/api/batch")
+async def download_batch(request: BatchRequest, http_request: Request):
+    """Download several URLs (or a playlist) and stream them back as one ZIP archive."""
+    urls = list(request.urls)
+    if request.playlist and not is_allowed_url(request.playlist):
+        raise HTTPException(status_code=400, detail="Unsupported playlist URL")
+    if request.playlist:
+        loop = asyncio.get_event_loop()
+        try:
+            urls += await loop.run_in_executor(None, expand_playlist, request.playlist, BATCH_MAX_ITEMS)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not read playlist: {str(e)}")
+    if not urls:
+        raise HTTPException(status_code=400, detail="Provide urls or a playlist")
+    if len(urls) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+    # Items are fetched server-side, so only supported video hosts are accepted
+    rejected = [u for u in urls if not is_allowed_url(u)]
+    if rejected:
+        raise HTTPException(status_code=400, detail=f"Unsupported URL: {truncate(rejected[0])}")
+
+    try:
+        admission.check('download')
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    logger.info(f"Starting batch of {len(urls)} items")
+    return StreamingResponse(
+        egress.throttle(stream_batch(urls, request.quality), client_key(http_request)),
+        media_type='application/zip',
+        headers={'Content-Disposition': content_disposition('videos.zip')}
+    )
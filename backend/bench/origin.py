@@ -0,0 +1,88 @@
+"""Local HTTP origin serving generated MP4/HLS fixtures for offline benchmarks."""
+import functools
+import logging
+import subprocess
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIXTURE_DIR = Path(__file__).parent / "fixtures"
+
+# name -> (duration in seconds, frame size); kept small so CI runs stay fast.
+FIXTURES = {
+    "short": (5, "640x360"),
+    "medium": (30, "1280x720"),
+}
+
+
+def generate_fixtures(fixture_dir: Path = DEFAULT_FIXTURE_DIR) -> Path:
+    """Render test-pattern clips with ffmpeg unless they already exist."""
+    fixture_dir.mkdir(parents=True, exist_ok=True)
+    for name, (duration, size) in FIXTURES.items():
+        mp4_path = fixture_dir / f"{name}.mp4"
+        if not mp4_path.exists():
+            logger.info(f"Generating fixture {mp4_path}")
+            subprocess.run([
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                "-f", "lavfi", "-i", f"testsrc=duration={duration}:size={size}:rate=30",
+                "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+                "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+                "-c:a", "aac", "-shortest", "-movflags", "faststart",
+                str(mp4_path)
+            ], check=True)
+
+        hls_dir = fixture_dir / f"{name}_hls"
+        if not (hls_dir / "index.m3u8").exists():
+            hls_dir.mkdir(exist_ok=True)
+            subprocess.run([
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                "-i", str(mp4_path), "-c", "copy",
+                "-f", "hls", "-hls_time", "2", "-hls_playlist_type", "vod",
+                str(hls_dir / "index.m3u8")
+            ], check=True)
+    return fixture_dir
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # yt-dlp routinely closes connections early (probing, cancelled
+        # fragments); those broken pipes are expected noise here.
+        pass
+
+
+class FixtureOrigin:
+    """Serve the fixture directory on 127.0.0.1 from a background thread."""
+
+    def __init__(self, fixture_dir: Path = DEFAULT_FIXTURE_DIR, port: int = 0):
+        self.fixture_dir = fixture_dir
+        handler = functools.partial(_QuietHandler, directory=str(fixture_dir))
+        self.server = _QuietServer(("127.0.0.1", port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def url(self, name: str, hls: bool = False, tag: str = None) -> str:
+        """URL of a fixture; a distinct `tag` defeats URL-keyed caches."""
+        path = f"{name}_hls/index.m3u8" if hls else f"{name}.mp4"
+        url = f"{self.base_url}/{path}"
+        return f"{url}?n={tag}" if tag is not None else url
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
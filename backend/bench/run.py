@@ -0,0 +1,225 @@
+"""Load scenarios against a locally started backend and a fixture origin.
+
+Everything runs on 127.0.0.1, so the suite works offline in CI (ffmpeg must
+be on PATH to render the fixtures). Run from the backend directory:
+
+    python -m bench.run --requests 20 --concurrency 4
+    python -m bench.run --scenarios download-cold,download-hot --json bench.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import aiohttp
+
+from bench.origin import DEFAULT_FIXTURE_DIR, FixtureOrigin, generate_fixtures
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def read_rss(pid: int) -> int:
+    """Resident set size of a process in bytes (Linux only, 0 elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler:
+    """Track the peak RSS of a process while a scenario runs."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, read_rss(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, read_rss(self.pid))
+
+
+class BackendServer:
+    """Run the FastAPI app under uvicorn in a child process."""
+
+    def __init__(self, port: int = 0):
+        self.port = port or _free_port()
+        self.process = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        # The fixture origin is on 127.0.0.1, which the API rejects unless allowed explicitly.
+        env = dict(os.environ, TRACE_SAMPLE_RATE="0", LOG_LEVEL="WARNING", EXTRA_ALLOWED_HOSTS="127.0.0.1")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=str(BACKEND_DIR), env=env
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("Backend exited during startup")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.5):
+                    return self
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("Backend did not start within 30s")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _http_scenario(base_url: str, path: str, payloads, concurrency: int):
+    """POST each payload with bounded concurrency; return (latencies, bytes, errors)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    received = 0
+    timeout = aiohttp.ClientTimeout(total=600)
+
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async def one(payload):
+            nonlocal errors, received
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with session.post(f"{base_url}{path}", json=payload) as response:
+                        body = await response.read()
+                        if response.status != 200:
+                            errors += 1
+                            return
+                        received += len(body)
+                except aiohttp.ClientError:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one(p) for p in payloads))
+    return latencies, received, errors
+
+
+def build_payloads(origin: FixtureOrigin, scenario: str, count: int):
+    hot = scenario.endswith("-hot")
+    hls = scenario.endswith("-hls")
+    payloads = []
+    for i in range(count):
+        url = origin.url("short", hls=hls, tag=None if hot else f"{scenario}-{i}")
+        payload = {"url": url}
+        if scenario.startswith("download"):
+            payload.update({
+                "platform": "generic",
+                "quality": 360,
+                "filename": f"bench_{scenario}_{i}.mp4"
+            })
+        payloads.append(payload)
+    return payloads
+
+
+# /api/info always extracts afresh, so it only has a cold scenario; download-hot
+# is served from the result store.
+SCENARIOS = ["info-cold", "download-cold", "download-hot", "download-hls"]
+
+
+def run(args) -> list:
+    fixture_dir = generate_fixtures(Path(args.fixtures))
+    results = []
+    with FixtureOrigin(fixture_dir) as origin, BackendServer() as server:
+        for scenario in args.scenarios:
+            path = "/api/info" if scenario.startswith("info") else "/api/download"
+            payloads = build_payloads(origin, scenario, args.requests)
+            with RssSampler(server.process.pid) as rss:
+                started = time.perf_counter()
+                latencies, nbytes, errors = asyncio.run(
+                    _http_scenario(server.base_url, path, payloads, args.concurrency))
+                wall = time.perf_counter() - started
+
+            results.append({
+                "scenario": scenario,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "errors": errors,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                "mb_per_s": round(nbytes / wall / 1024 ** 2, 2) if wall else 0.0,
+                "peak_rss_mb": round(rss.peak / 1024 ** 2, 1),
+            })
+    return results
+
+
+def print_table(results):
+    columns = ["scenario", "requests", "errors", "p50_ms", "p95_ms", "p99_ms", "mb_per_s", "peak_rss_mb"]
+    print("  ".join(f"{c:>14}" for c in columns))
+    for row in results:
+        print("  ".join(f"{row[c]!s:>14}" for c in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the video backend against a local fixture origin.")
+    parser.add_argument("--requests", type=int, default=10, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent requests")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda s: [x for x in s.split(",") if x],
+                        help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--fixtures", default=str(DEFAULT_FIXTURE_DIR), help="fixture directory")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = run(args)
+    print_table(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Measure cold start: importing the app and time until /healthz answers.
+
+Each run uses a fresh interpreter, like a new Render instance. Exits non-zero
+when a median exceeds its budget or when importing the app pulls in a
+dependency that is meant to load lazily. Run from the backend directory:
+
+    python -m bench.startup --runs 5
+    python -m bench.startup --max-import-seconds 1.0 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+from bench.run import BACKEND_DIR, _free_port
+
+# Importing main must not import these; deps.warm_up() loads them after startup.
+LAZY = ("yt_dlp", "aiohttp", "ffmpeg", "requests")
+
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "eager": [m for m in %r if m in sys.modules]}))
+""" % (LAZY,)
+
+
+def _env() -> dict:
+    return dict(os.environ, TRACE_SAMPLE_RATE="0", LOG_LEVEL="WARNING")
+
+
+def measure_import() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE], cwd=str(BACKEND_DIR), env=_env(),
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure_healthz(timeout: float = 30) -> float:
+    """Seconds from spawning uvicorn until /healthz returns 200."""
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=str(BACKEND_DIR), env=_env()
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError("Backend exited during startup")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"/healthz did not answer within {timeout}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure backend cold start time.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--max-import-seconds", type=float, default=1.5, help="budget for the median import time")
+    parser.add_argument("--max-healthz-seconds", type=float, default=3.0,
+                        help="budget for the median time until /healthz answers")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    imports = [measure_import() for _ in range(args.runs)]
+    healthz = [measure_healthz() for _ in range(args.runs)]
+    result = {
+        "import_seconds": round(statistics.median(i["seconds"] for i in imports), 3),
+        "healthz_seconds": round(statistics.median(healthz), 3),
+        "eager_imports": sorted({m for i in imports for m in i["eager"]}),
+    }
+    print(f"import main     {result['import_seconds']:.3f}s (budget {args.max_import_seconds}s)")
+    print(f"first /healthz  {result['healthz_seconds']:.3f}s (budget {args.max_healthz_seconds}s)")
+    if result["eager_imports"]:
+        print(f"imported eagerly: {', '.join(result['eager_imports'])}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2))
+
+    failed = (result["import_seconds"] > args.max_import_seconds
+              or result["healthz_seconds"] > args.max_healthz_seconds
+              or result["eager_imports"])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
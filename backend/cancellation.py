@@ -0,0 +1,166 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from fastapi import Request
+
+from deps import ffmpeg, yt_dlp
+
+logger = logging.getLogger(__name__)
+
+# How often a running job checks whether its client has gone away.
+DISCONNECT_POLL_SECONDS = 1.0
+# Cancel reason when the server, rather than the client, gave up on a job (shutdown).
+REQUEST_ABORTED = "request aborted"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once its token is cancelled."""
+
+
+@functools.lru_cache(maxsize=None)
+def _cancelled_error() -> type:
+    """JobCancelled mixed with yt-dlp's DownloadCancelled, which yt-dlp
+    re-raises even with ignoreerrors set, so raising it from a hook aborts the
+    download. Built on first use to keep yt-dlp out of startup.
+    """
+    return type('JobCancelled', (JobCancelled, yt_dlp.utils.DownloadCancelled), {})
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client of a running job has disconnected."""
+
+
+class CancelToken:
+    """Cooperative cancellation shared by a job's threads and subprocesses.
+
+    Blocking code calls `check()` at safe points (yt-dlp hooks, between
+    attempts); subprocesses registered with `subprocess()` are killed the
+    moment the token is cancelled.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        self.reason = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            processes = list(self._processes)
+        for process in processes:
+            _kill(process)
+
+    def check(self):
+        if self._event.is_set():
+            raise _cancelled_error()(self.reason)
+
+    def hook(self, d):
+        """yt-dlp progress/postprocessor hook aborting the job once cancelled."""
+        self.check()
+
+    def wait(self, seconds: float):
+        """Sleep for `seconds`, waking up and raising as soon as the token is cancelled."""
+        self._event.wait(seconds)
+        self.check()
+
+    @contextmanager
+    def subprocess(self, process):
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self._event.is_set()
+        if cancelled:
+            _kill(process)
+        try:
+            yield process
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+
+def _kill(process):
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not kill subprocess {process.pid}: {str(e)}")
+
+
+class JobRegistry:
+    """Cancel tokens of the jobs running in this worker, by download id."""
+
+    def __init__(self):
+        self._tokens = {}
+
+    def start(self, job_id: str) -> CancelToken:
+        token = CancelToken()
+        self._tokens[job_id] = token
+        return token
+
+    def finish(self, job_id: str):
+        self._tokens.pop(job_id, None)
+
+    def cancel(self, job_id: str, reason: str = "cancelled") -> bool:
+        token = self._tokens.get(job_id)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+
+jobs = JobRegistry()
+
+
+def run_ffmpeg(stream, token: Optional[CancelToken] = None):
+    """Run an ffmpeg-python command like `.run(quiet=True)`, killing it if `token` is cancelled."""
+    process = stream.run_async(pipe_stdout=True, pipe_stderr=True)
+    if token is None:
+        out, err = process.communicate()
+    else:
+        with token.subprocess(process):
+            out, err = process.communicate()
+        token.check()
+    if process.returncode:
+        raise ffmpeg.Error('ffmpeg', out, err)
+    return out, err
+
+
+async def run_until_disconnect(request: Request, token: CancelToken, func, *args, **kwargs):
+    """Run blocking `func` in the executor, cancelling `token` if the client disconnects.
+
+    The request's context is copied into the worker thread so its spans still
+    land in the request trace. On disconnect ClientDisconnected is raised
+    right away; the job unwinds and frees its resources in the background at
+    its next cancellation check.
+    """
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(None, functools.partial(context.run, func, *args, **kwargs))
+    try:
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return future.result()
+            if await request.is_disconnected():
+                token.cancel("client disconnected")
+                raise ClientDisconnected()
+    except BaseException:
+        # Covers the handler itself being cancelled, e.g. on shutdown.
+        if not future.done():
+            token.cancel(REQUEST_ABORTED)
+            # Nobody will collect the outcome; retrieve it so it isn't logged as unhandled.
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        raise
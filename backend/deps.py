@@ -0,0 +1,62 @@
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Stand-in for a module that is only imported on first attribute access.
+
+    yt-dlp and aiohttp take a good part of a second to import, which a cold
+    start would otherwise spend before the server can answer anything.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}{' (loaded)' if self.loaded else ''}>"
+
+
+yt_dlp = LazyModule('yt_dlp')
+ffmpeg = LazyModule('ffmpeg')
+aiohttp = LazyModule('aiohttp')
+
+LAZY_MODULES = (yt_dlp, ffmpeg, aiohttp)
+
+# Set once warm_up() has finished; /healthz reports it.
+warmed = threading.Event()
+
+
+def warm_up():
+    """Import the heavy dependencies and prime yt-dlp's extractor matching (blocking).
+
+    Run in the background at startup so the first real request doesn't pay
+    for it. Matching a URL compiles every extractor's URL pattern, which
+    costs about as much as importing yt-dlp itself.
+    """
+    started = time.perf_counter()
+    for module in LAZY_MODULES:
+        module.load()
+    for extractor in yt_dlp.extractor.gen_extractor_classes():
+        extractor.suitable('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+    warmed.set()
+    logger.info(f"Dependencies warmed up in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel
+
+from metrics import EGRESS_ACTIVE_STREAMS, EGRESS_THROTTLED_SECONDS
+from profiling import require_admin
+
+logger = logging.getLogger(__name__)
+
+# 0 disables a limit. Rates are in bytes per second and apply per worker process.
+EGRESS_GLOBAL_BYTES_PER_SEC = int(os.environ.get("EGRESS_GLOBAL_BYTES_PER_SEC", 0))
+EGRESS_CLIENT_BYTES_PER_SEC = int(os.environ.get("EGRESS_CLIENT_BYTES_PER_SEC", 0))
+# Responses up to this size get a larger share of the global rate.
+EGRESS_SMALL_FILE_BYTES = int(os.environ.get("EGRESS_SMALL_FILE_BYTES", 25 * 1024 ** 2))
+EGRESS_SMALL_FILE_WEIGHT = float(os.environ.get("EGRESS_SMALL_FILE_WEIGHT", 4))
+# Only honour X-Forwarded-For when a trusted proxy sets it; otherwise clients could pick their own bucket.
+EGRESS_TRUST_FORWARDED_FOR = os.environ.get("EGRESS_TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+
+
+class EgressSettings(BaseModel):
+    global_bytes_per_sec: Optional[int] = None
+    client_bytes_per_sec: Optional[int] = None
+    small_file_bytes: Optional[int] = None
+    small_file_weight: Optional[float] = None
+
+
+class _Stream:
+    def __init__(self, client: str, weight: float):
+        self.client = client
+        self.weight = weight
+        self.next_send = time.monotonic()
+
+
+class EgressScheduler:
+    """Pace response bodies against a global and a per-client byte rate.
+
+    The global rate is split between active streams in proportion to their
+    weight (small files weigh more), so a few large transfers can't starve
+    everyone else. Each client's streams share that client's rate. Pacing
+    works by sleeping before each chunk until the stream is within its rate.
+    A stream whose client reads slower than its share leaves that share unused.
+    """
+
+    def __init__(self):
+        self.global_rate = EGRESS_GLOBAL_BYTES_PER_SEC
+        self.client_rate = EGRESS_CLIENT_BYTES_PER_SEC
+        self.small_file_bytes = EGRESS_SMALL_FILE_BYTES
+        self.small_file_weight = EGRESS_SMALL_FILE_WEIGHT
+        self.streams = set()
+        self.total_weight = 0.0
+        # client -> [active stream count, next send time]
+        self.clients = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.global_rate or self.client_rate)
+
+    def configure(self, settings: EgressSettings):
+        for field, value in settings.dict(exclude_none=True).items():
+            if value < 0:
+                raise ValueError(f"{field} must not be negative")
+        if settings.global_bytes_per_sec is not None:
+            self.global_rate = settings.global_bytes_per_sec
+        if settings.client_bytes_per_sec is not None:
+            self.client_rate = settings.client_bytes_per_sec
+        if settings.small_file_bytes is not None:
+            self.small_file_bytes = settings.small_file_bytes
+        if settings.small_file_weight is not None:
+            self.small_file_weight = settings.small_file_weight or 1.0
+        logger.info(f"Egress limits set to global={self.global_rate}B/s client={self.client_rate}B/s")
+
+    def _open(self, client: str, size: Optional[int]) -> _Stream:
+        small = size is not None and size <= self.small_file_bytes
+        stream = _Stream(client, self.small_file_weight if small else 1.0)
+        self.streams.add(stream)
+        self.total_weight += stream.weight
+        state = self.clients.setdefault(client, [0, time.monotonic()])
+        state[0] += 1
+        EGRESS_ACTIVE_STREAMS.set(len(self.streams))
+        return stream
+
+    def _close(self, stream: _Stream):
+        self.streams.discard(stream)
+        self.total_weight = max(self.total_weight - stream.weight, 0.0)
+        state = self.clients.get(stream.client)
+        if state is not None:
+            state[0] -= 1
+            if state[0] <= 0:
+                del self.clients[stream.client]
+        EGRESS_ACTIVE_STREAMS.set(len(self.streams))
+
+    def _delay(self, stream: _Stream, nbytes: int) -> float:
+        now = time.monotonic()
+        delay = 0.0
+        if self.global_rate:
+            share = self.global_rate * stream.weight / max(self.total_weight, stream.weight)
+            stream.next_send = max(stream.next_send, now) + nbytes / share
+            delay = stream.next_send - now
+        if self.client_rate:
+            state = self.clients[stream.client]
+            state[1] = max(state[1], now) + nbytes / self.client_rate
+            delay = max(delay, state[1] - now)
+        return delay
+
+    async def throttle(self, chunks: AsyncIterator[bytes], client: str, size: Optional[int] = None):
+        """Yield `chunks` no faster than the current limits allow."""
+        stream = self._open(client, size)
+        try:
+            async for chunk in chunks:
+                if self.enabled:
+                    delay = self._delay(stream, len(chunk))
+                    if delay > 0:
+                        EGRESS_THROTTLED_SECONDS.inc(delay)
+                        await asyncio.sleep(delay)
+                yield chunk
+        finally:
+            self._close(stream)
+
+
+def client_key(request: Request) -> str:
+    """Identify the client a response is for, for per-client limits."""
+    if EGRESS_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get('x-forwarded-for', '').split(',')[0].strip()
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else 'unknown'
+
+
+egress = EgressScheduler()
+
+router = APIRouter(prefix="/admin/egress", dependencies=[Depends(require_admin)])
+
+
+def _state() -> dict:
+    return {
+        'global_bytes_per_sec': egress.global_rate,
+        'client_bytes_per_sec': egress.client_rate,
+        'small_file_bytes': egress.small_file_bytes,
+        'small_file_weight': egress.small_file_weight,
+        'active_streams': len(egress.streams),
+        'active_clients': len(egress.clients),
+    }
+
+
+@router.get("")
+async def get_egress_settings():
+    """Current egress limits and activity."""
+    return _state()
+
+
+@router.put("")
+async def update_egress_settings(settings: EgressSettings):
+    """Change egress limits at runtime; omitted fields keep their value, 0 disables a limit."""
+    try:
+        egress.configure(settings)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _state()
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+FILE_CACHE_PRUNE_INTERVAL = int(os.environ.get("FILE_CACHE_PRUNE_INTERVAL", 300))
+# Temp files older than this were left by a crashed writer.
+TEMP_MAX_AGE_SECONDS = 3600
+
+
+class KeyedLocks:
+    """One asyncio lock per key, dropped once nobody holds or waits for it.
+
+    The entry stays while any coroutine is waiting, so a waiter and a new
+    arrival always contend for the same lock, and it is removed on every
+    exit path, errors and early returns included.
+    """
+
+    def __init__(self):
+        self._locks = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+
+def temp_path(destination: Path) -> Path:
+    """A new, uniquely named file beside `destination`, to be moved over it with os.replace.
+
+    Unique per writer, so concurrent writers (other coroutines, or other
+    worker processes sharing the directory) never write into the same file.
+    The original suffix is kept last for tools that pick a format by it.
+    """
+    fd, name = tempfile.mkstemp(dir=str(destination.parent), prefix=f".{destination.stem}.",
+                                suffix=f".tmp{destination.suffix}")
+    os.close(fd)
+    return Path(name)
+
+
+def touch(path: Path):
+    """Record a cache hit; the mtime doubles as the last-access time for pruning."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def prune_directory(directory: Path, max_bytes: int) -> int:
+    """Drop abandoned temp files, then the least recently used files over `max_bytes`."""
+    now = time.time()
+    entries = []
+    removed = 0
+    try:
+        paths = list(directory.iterdir())
+    except FileNotFoundError:
+        return 0
+    for path in paths:
+        try:
+            stat = path.stat()
+            if not path.is_file():
+                continue
+            if '.tmp' in path.name:
+                if now - stat.st_mtime > TEMP_MAX_AGE_SECONDS:
+                    path.unlink()
+                    removed += 1
+                continue
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    return removed
+
+
+async def run_pruner(directory: Path, max_bytes: int, interval: float = FILE_CACHE_PRUNE_INTERVAL):
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            removed = await loop.run_in_executor(None, prune_directory, directory, max_bytes)
+            if removed:
+                logger.info(f"Pruned {removed} files from {directory}")
+        except Exception as e:
+            logger.error(f"Pruning {directory} failed: {str(e)}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,111 @@
+import threading
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+# Indexes kept for recently extracted format lists, so an endpoint, the
+# prefetch it triggers and later streams of the cached info share one build.
+FORMAT_INDEX_CACHE_MAX = 64
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class FormatIndex:
+    """Columnar view of a video's formats, built in one pass.
+
+    yt-dlp lists formats worst first; rows here are ordered by height,
+    tallest first, keeping yt-dlp's order within a height. Queries scan the
+    columns instead of calling dict.get on every format, and return the
+    original format dicts.
+    """
+
+    def __init__(self, formats: Optional[list]):
+        formats = [f for f in formats or [] if isinstance(f, dict)]
+        self.formats = sorted(formats, key=lambda f: -(f.get('height') or 0))
+        self.height = array('l')
+        self.tbr = array('d')
+        self.size = array('q')
+        self.vcodec = []
+        self.acodec = []
+        self.ext = []
+        self.protocol = []
+        self.noted = []
+        self.has_url = []
+        for f in self.formats:
+            self.height.append(int(f.get('height') or 0))
+            self.tbr.append(f.get('tbr') or 0)
+            self.size.append(int(f.get('filesize') or f.get('filesize_approx') or 0))
+            self.vcodec.append(f.get('vcodec'))
+            self.acodec.append(f.get('acodec'))
+            self.ext.append(f.get('ext'))
+            self.protocol.append(f.get('protocol') or 'https')
+            self.noted.append(bool(f.get('format_note')))
+            self.has_url.append(bool(f.get('url')))
+
+    def __len__(self):
+        return len(self.formats)
+
+    def _progressive(self, i: int) -> bool:
+        return self.vcodec[i] != 'none' and self.acodec[i] != 'none'
+
+    def heights(self, progressive: bool = False) -> List[int]:
+        """Distinct known heights, tallest first."""
+        return [height for height, _ in self.first_per_height(progressive)]
+
+    def first_per_height(self, progressive: bool = False) -> List[Tuple[int, dict]]:
+        """(height, format) for the first format yt-dlp lists at each known height, tallest first."""
+        found = []
+        last = None
+        for i, height in enumerate(self.height):
+            if height and height != last and (not progressive or self._progressive(i)):
+                found.append((height, self.formats[i]))
+                last = height
+        return found
+
+    def best_video(self, max_height: int, progressive: bool = True,
+                   protocols: Optional[Iterable[str]] = None) -> Optional[dict]:
+        """Tallest video format at or below `max_height`, the highest bitrate among equals.
+
+        With `protocols`, only formats with a direct URL over one of them qualify.
+        """
+        best = None
+        for i, height in enumerate(self.height):
+            if height > max_height or self.vcodec[i] == 'none' or (progressive and self.acodec[i] == 'none'):
+                continue
+            if protocols is not None and not (self.has_url[i] and self.protocol[i] in protocols):
+                continue
+            if best is not None and height < self.height[best]:
+                break
+            if best is None or self.tbr[i] > self.tbr[best]:
+                best = i
+        return self.formats[best] if best is not None else None
+
+    def expected_bytes(self, height: int) -> Optional[int]:
+        """Largest known size among formats at `height`; a safe estimate for scratch placement."""
+        return max((size for h, size in zip(self.height, self.size) if h == height), default=0) or None
+
+    def select(self, ext: Optional[str] = None, noted: bool = False) -> List[dict]:
+        """Formats with the given extension and, if `noted`, a format note; tallest first."""
+        return [
+            self.formats[i] for i in range(len(self.formats))
+            if (ext is None or self.ext[i] == ext) and (not noted or self.noted[i])
+        ]
+
+
+def index_formats(formats: Optional[list]) -> FormatIndex:
+    """The FormatIndex of an info dict's format list, built once per extraction and then reused."""
+    if not formats:
+        return FormatIndex(None)
+    key = id(formats)
+    with _cache_lock:
+        entry = _cache.get(key)
+        # The cached list itself is kept alive, so a matching id means the same list
+        if entry is not None and entry[0] is formats:
+            return entry[1]
+    index = FormatIndex(formats)
+    with _cache_lock:
+        _cache.pop(key, None)
+        _cache[key] = (formats, index)
+        while len(_cache) > FORMAT_INDEX_CACHE_MAX:
+            _cache.pop(next(iter(_cache)))
+    return index
@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from deps import ffmpeg
+from format_index import index_formats
+from metrics import FFMPEG_DURATION, QUEUE_DEPTH, record_cache
+
+logger = logging.getLogger(__name__)
+
+HLS_ROOT = Path(os.environ.get("HLS_ROOT", os.path.join(tempfile.gettempdir(), 'vidconvertly-hls')))
+HLS_MAX_SESSIONS = int(os.environ.get("HLS_MAX_SESSIONS", 4))
+# Stop remuxing when no player has asked for anything in this long.
+HLS_IDLE_SECONDS = int(os.environ.get("HLS_IDLE_SECONDS", 60))
+# Segments (finished or partial) are kept this long for other viewers.
+HLS_TTL_SECONDS = int(os.environ.get("HLS_TTL_SECONDS", 1800))
+HLS_START_TIMEOUT = float(os.environ.get("HLS_START_TIMEOUT", 20))
+HLS_SEGMENT_SECONDS = 4
+# Abort a stalled read from the platform instead of holding a worker (microseconds).
+HLS_READ_TIMEOUT_US = 15 * 1000 * 1000
+HLS_MAX_HEIGHT = 720
+HLS_PROTOCOLS = ('http', 'https', 'm3u8', 'm3u8_native')
+
+PLAYLIST_NAME = 'index.m3u8'
+_SEGMENT_RE = re.compile(r'^(init\.mp4|seg_\d{5}\.m4s)$')
+
+
+class HlsBusy(Exception):
+    """Raised when every remux slot is taken."""
+
+
+def select_formats(formats: list, format_id: str) -> List[dict]:
+    """Pick the format(s) to remux: one progressive format, or video plus the best audio."""
+    streamable = [f for f in formats or [] if f.get('url') and (f.get('protocol') or 'https') in HLS_PROTOCOLS]
+    if format_id != 'best':
+        chosen = next((f for f in streamable if f.get('format_id') == format_id), None)
+        if chosen is None:
+            raise ValueError(f"Format {format_id} is not available for streaming")
+    else:
+        index = index_formats(formats)
+        chosen = (index.best_video(HLS_MAX_HEIGHT, protocols=HLS_PROTOCOLS)
+                  or index.best_video(HLS_MAX_HEIGHT, progressive=False, protocols=HLS_PROTOCOLS))
+        if chosen is None:
+            raise ValueError("No streamable video format")
+
+    if chosen.get('acodec') != 'none' or chosen.get('vcodec') == 'none':
+        return [chosen]
+    audio = [f for f in streamable if f.get('vcodec') == 'none' and f.get('acodec') != 'none']
+    if not audio:
+        return [chosen]
+    # AAC copies into fMP4 everywhere; prefer it over Opus when both exist.
+    best_audio = max(audio, key=lambda f: (f.get('ext') == 'm4a', f.get('abr') or 0))
+    return [chosen, best_audio]
+
+
+def _input(stream_format: dict):
+    options = {'rw_timeout': HLS_READ_TIMEOUT_US}
+    headers = ''.join(f"{key}: {value}\r\n" for key, value in (stream_format.get('http_headers') or {}).items())
+    if headers:
+        options['headers'] = headers
+    return ffmpeg.input(stream_format['url'], **options)
+
+
+def _read_playlist(path: Path) -> Optional[str]:
+    try:
+        return path.read_text()
+    except FileNotFoundError:
+        return None
+
+
+class HlsSession:
+    def __init__(self, key: str, directory: Path, process: subprocess.Popen):
+        self.key = key
+        self.directory = directory
+        self.process = process
+        self.started = time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return self.process.poll() is None
+
+    def error_output(self) -> str:
+        try:
+            return (self.directory / 'ffmpeg.log').read_text(errors='replace')[-2000:]
+        except FileNotFoundError:
+            return ''
+
+    def stop(self):
+        if not self.running:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class HlsPackager:
+    """Remux a chosen format to fMP4 HLS segments on demand (stream copy, no re-encode).
+
+    Segments land in <root>/<hash of video id and format>/ so every worker can
+    serve them; only the worker that started ffmpeg tracks the process.
+    """
+
+    def __init__(self, root: Path = HLS_ROOT, max_sessions: int = HLS_MAX_SESSIONS):
+        self.root = root
+        self.max_sessions = max_sessions
+        self.sessions = {}
+
+    def directory(self, video_id: str, format_id: str) -> Path:
+        return self.root / hashlib.sha256(f"{video_id}:{format_id}".encode()).hexdigest()[:32]
+
+    @staticmethod
+    def touch(directory: Path):
+        """Record that a player used this stream; the reaper reads it to find idle sessions."""
+        try:
+            (directory / 'access').touch()
+        except FileNotFoundError:
+            pass
+
+    def _start(self, key: str, directory: Path, formats: List[dict]) -> HlsSession:
+        shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir(parents=True)
+        inputs = [_input(f) for f in formats]
+        streams = [inputs[0].video, inputs[1].audio] if len(inputs) == 2 else inputs
+        args = ffmpeg.output(
+            *streams,
+            str(directory / PLAYLIST_NAME),
+            c='copy',
+            f='hls',
+            hls_time=HLS_SEGMENT_SECONDS,
+            # A short first segment gets the player going sooner; cuts still
+            # have to fall on keyframes since nothing is re-encoded.
+            hls_init_time=1,
+            hls_list_size=0,
+            hls_playlist_type='event',
+            hls_segment_type='fmp4',
+            hls_fmp4_init_filename='init.mp4',
+            hls_segment_filename=str(directory / 'seg_%05d.m4s'),
+            hls_flags='temp_file+independent_segments',
+        ).global_args('-nostdin', '-loglevel', 'error').compile()
+        with open(directory / 'ffmpeg.log', 'wb') as log:
+            process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=log)
+        self.touch(directory)
+        session = HlsSession(key, directory, process)
+        self.sessions[key] = session
+        QUEUE_DEPTH.labels(queue='hls').set(len(self.sessions))
+        logger.info(f"Started HLS remux for {key} ({', '.join(f.get('format_id', '?') for f in formats)})")
+        return session
+
+    async def playlist(self, video_id: str, format_id: str, info: Optional[dict]) -> str:
+        """Return the playlist text, starting a remux if needed and waiting for the first segment."""
+        key = f"{video_id}:{format_id}"
+        directory = self.directory(video_id, format_id)
+        playlist_path = directory / PLAYLIST_NAME
+        session = self.sessions.get(key)
+
+        if session is None:
+            text = _read_playlist(playlist_path)
+            # A finished remux, or one another worker is running right now.
+            if text and ('#EXT-X-ENDLIST' in text or time.time() - playlist_path.stat().st_mtime < HLS_IDLE_SECONDS):
+                record_cache('hls', True)
+                self.touch(directory)
+                return text
+            record_cache('hls', False)
+            if info is None:
+                raise LookupError("Unknown video")
+            if sum(1 for s in self.sessions.values() if s.running) >= self.max_sessions:
+                raise HlsBusy("All remux slots are in use")
+            session = self._start(key, directory, select_formats(info.get('formats'), format_id))
+
+        self.touch(directory)
+        deadline = time.monotonic() + HLS_START_TIMEOUT
+        while True:
+            text = _read_playlist(playlist_path)
+            if text and '#EXTINF' in text:
+                return text
+            if not session.running:
+                self.sessions.pop(key, None)
+                raise RuntimeError(f"ffmpeg exited with {session.process.returncode}: {session.error_output()}")
+            if time.monotonic() > deadline:
+                raise TimeoutError("Timed out waiting for the first segment")
+            await asyncio.sleep(0.1)
+
+    def segment(self, video_id: str, format_id: str, name: str) -> Optional[Path]:
+        """Path of a finished segment, or None for unknown names and segments not written yet."""
+        if not _SEGMENT_RE.match(name):
+            return None
+        directory = self.directory(video_id, format_id)
+        path = directory / name
+        if not path.exists():
+            return None
+        self.touch(directory)
+        return path
+
+    def reap_sessions(self):
+        """Stop remuxes no player has used lately and forget the ones that ended."""
+        now = time.time()
+        for key, session in list(self.sessions.items()):
+            try:
+                idle = now - (session.directory / 'access').stat().st_mtime
+            except FileNotFoundError:
+                idle = HLS_IDLE_SECONDS + 1
+            if session.running and idle > HLS_IDLE_SECONDS:
+                logger.info(f"Stopping idle HLS remux for {key}")
+                # Only signal here; the process is collected on a later pass.
+                session.process.terminate()
+            if not session.running:
+                FFMPEG_DURATION.labels(operation='hls_remux').observe(time.monotonic() - session.started)
+                del self.sessions[key]
+        QUEUE_DEPTH.labels(queue='hls').set(len(self.sessions))
+
+    def prune(self, active) -> int:
+        """Delete streams nobody has used within the TTL."""
+        removed = 0
+        if not self.root.is_dir():
+            return removed
+        now = time.time()
+        for directory in self.root.iterdir():
+            if directory in active:
+                continue
+            try:
+                accessed = (directory / 'access').stat().st_mtime
+            except FileNotFoundError:
+                accessed = directory.stat().st_mtime
+            if now - accessed > HLS_TTL_SECONDS:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+        return removed
+
+    async def run_reaper(self, interval: float = 10):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                self.reap_sessions()
+                active = {session.directory for session in self.sessions.values()}
+                removed = await loop.run_in_executor(None, self.prune, active)
+                if removed:
+                    logger.info(f"Removed {removed} expired HLS streams")
+            except Exception as e:
+                logger.error(f"HLS reaper failed: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def stop_all(self):
+        for session in self.sessions.values():
+            session.stop()
+        self.sessions.clear()
+
+
+hls_packager = HlsPackager()
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Put this on a persistent disk, together with SCRATCH_ROOT, for jobs to survive a redeploy.
+JOBS_DB = os.environ.get("JOBS_DB", os.path.join(tempfile.gettempdir(), 'vidconvertly-jobs.sqlite3'))
+# Progress is written at most this often per job; status changes are written right away.
+JOB_CHECKPOINT_SECONDS = float(os.environ.get("JOB_CHECKPOINT_SECONDS", 2))
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", 10))
+# A worker that hasn't heartbeat in this long is presumed dead and its jobs are taken over,
+# unless it runs on this host and its process (same pid and start time) still exists.
+JOB_OWNER_TIMEOUT_SECONDS = float(os.environ.get("JOB_OWNER_TIMEOUT_SECONDS", 30))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 24 * 3600))
+
+# Jobs in these states are owned by a worker that is, or was, running them.
+ACTIVE_STATUSES = ('running', 'interrupted')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    download_id TEXT PRIMARY KEY,
+    cache_key TEXT,
+    filename TEXT,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress TEXT,
+    scratch_dir TEXT,
+    owner TEXT,
+    resumes INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_cache_key ON jobs (cache_key, status);
+CREATE INDEX IF NOT EXISTS jobs_filename ON jobs (filename, updated);
+CREATE TABLE IF NOT EXISTS workers (
+    instance TEXT PRIMARY KEY,
+    pid INTEGER,
+    host TEXT,
+    started TEXT,
+    heartbeat REAL NOT NULL
+);
+"""
+HOST = socket.gethostname()
+
+
+def _row(row: Optional[sqlite3.Row]) -> Optional[dict]:
+    if row is None:
+        return None
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['progress'] = json.loads(job['progress']) if job['progress'] else None
+    return job
+
+
+def process_start(pid: int) -> Optional[str]:
+    """Start time of a process in clock ticks since boot, or None if it doesn't exist or can't be read.
+
+    Tells a process apart from a later one given the same pid, as happens
+    to gunicorn workers after a container restart. Linux only.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces and parentheses; fields resume after the last ')'.
+    fields = stat[stat.rfind(')') + 2:].split()
+    return fields[19] if len(fields) > 19 else None
+
+
+class JobStore:
+    """Download jobs checkpointed to SQLite so they outlive the worker running them.
+
+    Every worker process shares the database. Workers heartbeat into it, and
+    a job whose owner stops heartbeating (killed, redeployed, or drained past
+    its deadline) is claimed by a surviving or newly started worker, which
+    resumes it from its scratch directory or fails it cleanly. An owner on
+    the same host whose process is still alive, checked by pid and start
+    time, is never taken over, however late its heartbeat; owners on other
+    hosts, or where start times can't be read, are judged by heartbeat alone.
+    """
+
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        # Identifies this process; pids are reused across container restarts.
+        self.instance = uuid.uuid4().hex
+        self._local = threading.local()
+        self._last_checkpoint = {}
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self._heartbeat_lock = threading.Lock()
+        self._heartbeat_thread = None
+        self._stopping = threading.Event()
+        self._started = process_start(os.getpid())
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit; the few multi-statement updates open their own transaction.
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    columns = {row['name'] for row in conn.execute("PRAGMA table_info(workers)")}
+                    for column in ('host', 'started'):
+                        if column not in columns:
+                            conn.execute(f"ALTER TABLE workers ADD COLUMN {column} TEXT")
+                    self._initialized = True
+        return conn
+
+    def _write(self, sql: str, params: tuple) -> int:
+        """Run a write, returning the affected row count; a broken store must not fail downloads."""
+        try:
+            return self._connect().execute(sql, params).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Job store write failed: {str(e)}")
+            return 0
+
+    def create(self, download_id: str, cache_key: Optional[str], filename: str, params: dict, progress: dict):
+        now = time.time()
+        self._write(
+            "INSERT OR REPLACE INTO jobs (download_id, cache_key, filename, params, status, progress, owner, created, updated)"
+            " VALUES (?, ?, ?, ?, 'running', ?, ?, ?, ?)",
+            (download_id, cache_key, filename, json.dumps(params), json.dumps(progress), self.instance, now, now)
+        )
+
+    def attach_scratch(self, download_id: str, directory: Path) -> bool:
+        """Record where the job keeps its partial files; False if the job isn't persisted."""
+        return self._write(
+            "UPDATE jobs SET scratch_dir = ?, updated = ? WHERE download_id = ? AND owner = ?",
+            (str(directory), time.time(), download_id, self.instance)
+        ) > 0
+
+    def checkpoint(self, download_id: str, progress: dict, force: bool = False):
+        """Persist a progress entry, throttled to one write per job every JOB_CHECKPOINT_SECONDS."""
+        now = time.monotonic()
+        if not force and now - self._last_checkpoint.get(download_id, 0) < JOB_CHECKPOINT_SECONDS:
+            return
+        self._last_checkpoint[download_id] = now
+        self._write(
+            "UPDATE jobs SET progress = ?, updated = ? WHERE download_id = ? AND owner = ?",
+            (json.dumps(progress), time.time(), download_id, self.instance)
+        )
+
+    def finish(self, download_id: str, status: str, error: Optional[str] = None) -> bool:
+        """Move a job owned by this worker to `status`; False if it isn't persisted or not ours."""
+        self._last_checkpoint.pop(download_id, None)
+        return self._write(
+            "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE download_id = ? AND owner = ?",
+            (status, error, time.time(), download_id, self.instance)
+        ) > 0
+
+    def get(self, download_id: str) -> Optional[dict]:
+        return _row(self._connect().execute(
+            "SELECT * FROM jobs WHERE download_id = ?", (download_id,)
+        ).fetchone())
+
+    def find_by_filename(self, filename: str) -> Optional[dict]:
+        """The most recent job writing `filename`."""
+        return _row(self._connect().execute(
+            "SELECT * FROM jobs WHERE filename = ? ORDER BY updated DESC LIMIT 1", (filename,)
+        ).fetchone())
+
+    def active(self, cache_key: str) -> Optional[dict]:
+        """A running or interrupted job producing `cache_key`, in any worker."""
+        return _row(self._connect().execute(
+            "SELECT * FROM jobs WHERE cache_key = ? AND status IN (?, ?) ORDER BY created LIMIT 1",
+            (cache_key, *ACTIVE_STATUSES)
+        ).fetchone())
+
+    def heartbeat(self):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO workers (instance, pid, host, started, heartbeat) VALUES (?, ?, ?, ?, ?)",
+            (self.instance, os.getpid(), HOST, self._started, time.time())
+        )
+
+    def start_heartbeat(self, interval: float = JOB_HEARTBEAT_SECONDS):
+        """Heartbeat from a dedicated thread, so a saturated executor or a busy event loop can't delay it."""
+        if self._heartbeat_thread is not None:
+            return
+
+        def beat():
+            while True:
+                with self._heartbeat_lock:
+                    if self._stopping.is_set():
+                        return
+                    try:
+                        self.heartbeat()
+                    except sqlite3.Error as e:
+                        logger.warning(f"Job heartbeat failed: {str(e)}")
+                if self._stopping.wait(interval):
+                    return
+
+        self._heartbeat_thread = threading.Thread(target=beat, name='job-heartbeat', daemon=True)
+        self._heartbeat_thread.start()
+
+    def leave(self):
+        """Stop heartbeating and drop this worker's row so others take over its jobs right away."""
+        with self._heartbeat_lock:
+            self._stopping.set()
+            self._write("DELETE FROM workers WHERE instance = ?", (self.instance,))
+
+    @staticmethod
+    def _owner_gone(row: sqlite3.Row) -> bool:
+        """Whether the owner of a job with a stale or missing heartbeat has really exited."""
+        if row['status'] == 'interrupted' or row['heartbeat'] is None:
+            return True
+        if row['host'] != HOST or row['started'] is None:
+            return True
+        # A reused pid has a different start time; a crashed worker's pid is often reused after a restart.
+        return process_start(row['pid']) != row['started']
+
+    def claim_orphans(self) -> List[dict]:
+        """Take over active jobs whose owner is gone or gave them up; returns the claimed jobs."""
+        conn = self._connect()
+        cutoff = time.time() - JOB_OWNER_TIMEOUT_SECONDS
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT jobs.download_id, jobs.status, workers.pid, workers.host, workers.started, workers.heartbeat"
+                " FROM jobs LEFT JOIN workers ON workers.instance = jobs.owner"
+                " WHERE jobs.status IN (?, ?) AND jobs.owner IS NOT ?"
+                " AND (jobs.status = 'interrupted' OR workers.heartbeat IS NULL OR workers.heartbeat < ?)",
+                (*ACTIVE_STATUSES, self.instance, cutoff)
+            ).fetchall()
+            ids = [row['download_id'] for row in rows if self._owner_gone(row)]
+            conn.executemany(
+                "UPDATE jobs SET status = 'running', owner = ?, resumes = resumes + 1, updated = ? WHERE download_id = ?",
+                [(self.instance, time.time(), download_id) for download_id in ids]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [self.get(download_id) for download_id in ids]
+
+    def prune(self) -> int:
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        conn = self._connect()
+        removed = conn.execute(
+            "DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated < ?", (*ACTIVE_STATUSES, cutoff)
+        ).rowcount
+        conn.execute("DELETE FROM workers WHERE heartbeat < ?", (cutoff,))
+        return removed
+
+    async def run_keeper(self, recover: Callable[[dict], None], interval: float = JOB_HEARTBEAT_SECONDS):
+        """Start heartbeating, then hand orphaned jobs to `recover` and prune old rows, every `interval`."""
+        loop = asyncio.get_event_loop()
+        self.start_heartbeat(interval)
+        passes = 0
+        while True:
+            try:
+                for job in await loop.run_in_executor(None, self.claim_orphans):
+                    recover(job)
+                if passes % 360 == 0:
+                    removed = await loop.run_in_executor(None, self.prune)
+                    if removed:
+                        logger.info(f"Pruned {removed} old job records")
+            except Exception as e:
+                logger.error(f"Job keeper failed: {str(e)}")
+            passes += 1
+            await asyncio.sleep(interval)
+
+
+job_store = JobStore()
@@ -0,0 +1,115 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Upper bound for payloads (API responses, info dicts, ...) written to the log.
+LOG_MAX_PAYLOAD = int(os.environ.get("LOG_MAX_PAYLOAD", "500"))
+# Progress lines are written at most once per interval or per step, per download.
+PROGRESS_LOG_INTERVAL = float(os.environ.get("PROGRESS_LOG_INTERVAL", "5"))
+PROGRESS_LOG_STEP = float(os.environ.get("PROGRESS_LOG_STEP", "25"))
+
+# Defaults for noisy third-party loggers; LOG_LEVELS overrides them.
+DEFAULT_MODULE_LEVELS = {
+    'yt_dlp': 'WARNING',
+    'httpx': 'WARNING',
+    'uvicorn.access': 'WARNING',
+}
+
+_configured = False
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def parse_module_levels(spec: str) -> dict:
+    """Parse "module=LEVEL,other=LEVEL" into a dict."""
+    levels = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """Set up leveled, queued logging from the LOG_* environment variables.
+
+    Records are handed to a QueueHandler so request handlers never block on
+    stream I/O; a background QueueListener does the formatting and writing.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    handler = logging.StreamHandler()
+    if os.environ.get("LOG_FORMAT", "text").lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+
+    if os.environ.get("LOG_QUEUE", "1") != "0":
+        log_queue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+    else:
+        root.addHandler(handler)
+
+    levels = dict(DEFAULT_MODULE_LEVELS)
+    levels.update(parse_module_levels(os.environ.get("LOG_LEVELS", "")))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def truncate(value, limit: int = None) -> str:
+    """Render a value for logging, cut down to at most `limit` characters."""
+    limit = LOG_MAX_PAYLOAD if limit is None else limit
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text) - limit} more chars)"
+
+
+class ProgressLogSampler:
+    """Decide which progress updates are worth a log line."""
+
+    def __init__(self, interval: float = PROGRESS_LOG_INTERVAL, step: float = PROGRESS_LOG_STEP):
+        self.interval = interval
+        self.step = step
+        self._last = {}
+
+    def should_log(self, key: str, progress: float) -> bool:
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is None or now - last[0] >= self.interval or progress - last[1] >= self.step:
+            self._last[key] = (now, progress)
+            return True
+        return False
+
+    def forget(self, key: str):
+        self._last.pop(key, None)
@@ -1,32 +1,53 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, Response
+from fastapi.responses import JSONResponse, FileResponse, Response
 from pydantic import BaseModel, validator, HttpUrl
 from typing import Optional, List, Dict, Any
-import yt_dlp
 import os
-import tempfile
-import shutil
 import logging
 import traceback
-from urllib.parse import quote, urlparse
-import aiohttp
 import asyncio
 import json
 from datetime import datetime
 import hashlib
-import requests
 import io
-import ffmpeg
 import re
+import uuid
+import functools
+import time
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from deps import yt_dlp, ffmpeg, warm_up, warmed
+from platforms import platforms, get_platform, is_allowed_url
+from metrics import (
+    router as metrics_router, MetricsMiddleware, PostprocessorTimer, observe, track_job,
+    observe_download_finished, EXTRACT_DURATION, DOWNLOAD_DURATION, FFMPEG_DURATION, JOB_RECOVERIES
+)
+from tracing import TracingMiddleware, span
+from logging_config import configure_logging, truncate, ProgressLogSampler
+from profiling import router as profiling_router, MemoryAccountingMiddleware, background_finished, background_started
+from storage import scratch, StorageFull
+from results import results, result_key, serve_result, safe_filename
+from batch import router as batch_router
+from thumbnails import get_thumbnail, run_cache_pruner as run_thumbnail_pruner
+from previews import get_preview_sprite, run_cache_pruner as run_preview_pruner
+from hls import hls_packager, HlsBusy, PLAYLIST_NAME
+from prefetch import prefetcher, PREFETCH_QUALITY
+from admission import admission, Overloaded, overloaded_response, EXECUTOR_THREADS
+from egress import router as egress_router
+from responses import FastJSONResponse, parse_fields, select_fields
+from format_index import index_formats
+from negative_cache import negative_cache, VideoUnavailable, ErrorRecorder, unavailable_response
+from job_store import job_store
+from cancellation import (
+    jobs, CancelToken, JobCancelled, ClientDisconnected, REQUEST_ABORTED, run_ffmpeg, run_until_disconnect
+)
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
+ytdlp_logger = logging.getLogger('yt_dlp')
+progress_log_sampler = ProgressLogSampler()
 
 # API Configuration
 SUPPORTED_PLATFORMS = {
@@ -43,27 +64,47 @@ SUPPORTED_PLATFORMS = {
 
 # In-memory storage for download progress
 download_progress = {}
+# Entries that reached one of these states are dropped this long after; the job store keeps the outcome.
+PROGRESS_RETENTION_SECONDS = int(os.environ.get("PROGRESS_RETENTION_SECONDS", 300))
+PROGRESS_PRUNE_INTERVAL = 60
+PROGRESS_TERMINAL_STATUSES = ('finished', 'failed', 'cancelled')
 
 # Add at the top of the file with other global variables
 video_info_cache = {}
+VIDEO_INFO_CACHE_MAX = int(os.environ.get("VIDEO_INFO_CACHE_MAX", 500))
+
+# Jobs interrupted by a restart are resumed at most this many times, and not once they are this old
+JOB_MAX_RESUMES = int(os.environ.get("JOB_MAX_RESUMES", 2))
+JOB_RESUME_MAX_AGE = int(os.environ.get("JOB_RESUME_MAX_AGE", 3600))
+JOB_WAIT_POLL_SECONDS = 1.0
+# Longest a request waits on another worker's job before running the download itself.
+JOB_WAIT_MAX_SECONDS = int(os.environ.get("JOB_WAIT_MAX_SECONDS", 600))
+# Background tasks resuming interrupted jobs in this worker, by download id
+resumed_jobs = {}
+
+INVALID_URL_MESSAGE = 'Invalid URL. Please enter a valid video URL from YouTube, Facebook, Instagram, TikTok, Twitter, or Pinterest.'
 
 class VideoRequest(BaseModel):
     url: str
     format_id: Optional[str] = None
     quality: Optional[str] = None
     download_id: Optional[str] = None
+    # Top-level response fields to return; all of them by default
+    fields: Optional[List[str]] = None
+    # Signed per-format stream URLs are long and expire quickly, so they are opt-in
+    include_urls: bool = False
 
     @validator('url')
     def validate_url(cls, v):
         if not v:
             raise ValueError('URL is required')
-        if not any(platform in v.lower() for platform in ['youtube.com', 'youtu.be', 'facebook.com', 'instagram.com', 'tiktok.com', 'twitter.com', 'pinterest.com']):
-            raise ValueError('Invalid URL. Please enter a valid video URL from YouTube, Facebook, Instagram, TikTok, Twitter, or Pinterest.')
+        if not is_allowed_url(v):
+            raise ValueError(INVALID_URL_MESSAGE)
         return v
 
 class VideoFormat(BaseModel):
     resolution: str
-    url: str
+    url: Optional[str] = None
     size: Optional[str] = None
     quality: Optional[str] = None
     format_id: Optional[str] = None
@@ -76,6 +117,7 @@ class VideoResponse(BaseModel):
     formats: List[VideoFormat]
     platform: str
     download_id: Optional[str] = None
+    video_id: Optional[str] = None
 
 class DownloadProgress(BaseModel):
     status: str
@@ -84,23 +126,46 @@ class DownloadProgress(BaseModel):
     eta: Optional[str] = None
     error: Optional[str] = None
 
-class VideoDownloadRequest(BaseModel):
-    url: str
-    format: str
-    fileName: str = None
-    compress: bool = False
-    quality: int = None
+# Audio-only output formats: yt-dlp selector, ffmpeg encoder, and the source
+# codec prefix for which the stream is copied instead of re-encoded.
+AUDIO_FORMATS = {
+    'm4a': {
+        'selector': 'bestaudio[ext=m4a]/bestaudio/best',
+        'codec': 'aac',
+        'copy_prefix': 'mp4a',
+        'bitrate': '192k',
+        'media_type': 'audio/mp4'
+    },
+    'opus': {
+        'selector': 'bestaudio[acodec=opus]/bestaudio/best',
+        'codec': 'libopus',
+        'copy_prefix': 'opus',
+        'bitrate': '128k',
+        'media_type': 'audio/ogg'
+    },
+    'mp3': {
+        'selector': 'bestaudio/best',
+        'codec': 'libmp3lame',
+        'copy_prefix': 'mp3',
+        'bitrate': '192k',
+        'media_type': 'audio/mpeg'
+    }
+}
 
 def generate_download_id(url: str) -> str:
-    """Generate a unique download ID based on URL and timestamp."""
+    """Generate a unique download ID based on URL, timestamp and a random suffix."""
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
     url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
-    return f"{timestamp}_{url_hash}"
+    return f"{timestamp}_{url_hash}_{uuid.uuid4().hex[:8]}"
 
-def progress_hook(d):
-    """Track download progress."""
+def progress_hook(d, download_id=None, filename=None):
+    """Track download progress.
+
+    `download_id` and `filename` are bound per job with functools.partial so
+    that concurrent downloads never report into each other's entries.
+    """
     if d['status'] == 'downloading':
-        download_id = d.get('info_dict', {}).get('download_id')
+        download_id = download_id or d.get('info_dict', {}).get('download_id')
         if download_id:
             try:
                 # Calculate progress percentage
@@ -112,7 +177,7 @@ def progress_hook(d):
                     progress = 0
 
                 # Get filename from info_dict or use a default
-                filename = d.get('info_dict', {}).get('filename', 'video.mp4')
+                filename = filename or d.get('info_dict', {}).get('filename', 'video.mp4')
                 if filename:
                     # Clean the filename to avoid URL encoding issues
                     filename = filename.split('/')[-1]  # Get just the filename part
@@ -120,31 +185,36 @@ def progress_hook(d):
 
                 download_progress[download_id] = {
                     'status': 'downloading',
-                    'progress': f"{progress:.1f}",
+                    'progress': round(progress, 1),
                     'speed': d.get('_speed_str', 'N/A'),
                     'eta': d.get('_eta_str', 'N/A'),
                     'downloaded_bytes': downloaded_bytes,
                     'total_bytes': total_bytes,
                     'filename': filename
                 }
-                logger.info(f"Download progress for {download_id}: {progress:.1f}%")
+                job_store.checkpoint(download_id, download_progress[download_id])
+                if progress_log_sampler.should_log(download_id, progress):
+                    logger.info(f"Download progress for {download_id}: {progress:.1f}%")
             except Exception as e:
                 logger.error(f"Error updating progress: {str(e)}")
     elif d['status'] == 'finished':
-        download_id = d.get('info_dict', {}).get('download_id')
+        observe_download_finished(d)
+        download_id = download_id or d.get('info_dict', {}).get('download_id')
         if download_id:
-            filename = d.get('info_dict', {}).get('filename', 'video.mp4')
+            filename = filename or d.get('info_dict', {}).get('filename', 'video.mp4')
             if filename:
                 filename = filename.split('/')[-1]
                 filename = filename.replace(' ', '_')
 
             download_progress[download_id] = {
                 'status': 'finished',
-                'progress': '100',
+                'progress': 100.0,
                 'speed': 'N/A',
                 'eta': 'N/A',
                 'filename': filename
             }
+            job_store.checkpoint(download_id, download_progress[download_id], force=True)
+            progress_log_sampler.forget(download_id)
             logger.info(f"Download finished for {download_id}")
 
 app = FastAPI()
@@ -156,167 +226,121 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Content-Disposition", "X-Download-Id", "Accept-Ranges", "Content-Range", "ETag",
+                    "X-Sprite-Frames", "X-Sprite-Columns", "X-Sprite-Rows", "X-Sprite-Tile-Width", "X-Sprite-Tile-Height"],
 )
-
-def get_platform(url: str) -> str:
-    """Determine the platform from the URL."""
-    if 'youtube.com' in url or 'youtu.be' in url:
-        return 'youtube'
-    elif 'facebook.com' in url or 'fb.watch' in url:
-        return 'facebook'
-    elif 'instagram.com' in url:
-        return 'instagram'
-    elif 'tiktok.com' in url:
-        return 'tiktok'
-    else:
-        raise ValueError("Unsupported platform")
-
-async def fetch_from_rapidapi(platform: str, url: str) -> Dict:
-    """Fetch video information from RapidAPI."""
-    if platform not in API_CONFIGS:
-        raise HTTPException(status_code=400, detail=f"Platform {platform} not supported")
-    
-    api_config = API_CONFIGS[platform]
-    headers = {
-        "X-RapidAPI-Key": RAPIDAPI_KEY,
-        "X-RapidAPI-Host": api_config["host"]
-    }
-    
-    params = {"url": url}
-    if platform == "youtube":
-        params["format"] = "mp4"
-    
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(api_config["url"], headers=headers, params=params) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    logger.error(f"RapidAPI error for {platform}: {error_text}")
-                    raise HTTPException(
-                        status_code=response.status,
-                        detail=f"Failed to fetch video from {platform}"
-                    )
-                
-                data = await response.json()
-                logger.info(f"RapidAPI response for {platform}: {data}")
-                return data
-                
-        except aiohttp.ClientError as e:
-            logger.error(f"RapidAPI request failed for {platform}: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to connect to {platform} service"
-            )
-
-def parse_rapidapi_response(platform: str, data: Dict) -> VideoResponse:
-    """Parse RapidAPI response into our VideoResponse format."""
-    try:
-        if platform == "youtube":
-            formats = []
-            # Handle the new YouTube API response format
-            if isinstance(data, dict):
-                # Check for different quality options
-                for quality, url in data.get("downloads", {}).items():
-                    if url and isinstance(url, str):
-                        formats.append(VideoFormat(
-                            resolution=quality,
-                            url=url,
-                            quality=quality,
-                            format_id=quality,
-                            ext="mp4"
-                        ))
-                
-                return VideoResponse(
-                    title=data.get("title", ""),
-                    thumbnail=data.get("thumbnail", ""),
-                    duration=str(data.get("duration", "")),
-                    formats=formats,
-                    platform=platform
-                )
-            else:
-                raise HTTPException(status_code=400, detail="Invalid response format from YouTube API")
-        
-        elif platform == "facebook":
-            formats = []
-            # Handle the new Facebook API response format
-            if isinstance(data, dict):
-                # Check for HD quality
-                if hd_url := data.get("hd"):
-                    formats.append(VideoFormat(
-                        resolution="HD",
-                        url=hd_url,
-                        quality="HD",
-                        format_id="hd",
-                        ext="mp4"
-                    ))
-                # Check for SD quality
-                if sd_url := data.get("sd"):
-                    formats.append(VideoFormat(
-                        resolution="SD",
-                        url=sd_url,
-                        quality="SD",
-                        format_id="sd",
-                        ext="mp4"
-                    ))
-                # Check for thumbnail
-                thumbnail = data.get("thumb", "")
-                
-                return VideoResponse(
-                    title=data.get("title", ""),
-                    thumbnail=thumbnail,
-                    formats=formats,
-                    platform=platform
-                )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MemoryAccountingMiddleware)
+app.include_router(metrics_router)
+app.include_router(profiling_router)
+app.include_router(batch_router)
+app.include_router(egress_router)
+
+@app.on_event("startup")
+async def size_executor():
+    """Give the default executor a thread for every job admission lets run at once."""
+    asyncio.get_event_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=EXECUTOR_THREADS, thread_name_prefix='executor')
+    )
+
+@app.on_event("startup")
+async def start_scratch_janitor():
+    """Reclaim scratch files left behind by crashed workers, now and periodically."""
+    asyncio.create_task(scratch.run_janitor())
+    asyncio.create_task(results.run_pruner())
+    asyncio.create_task(run_thumbnail_pruner())
+    asyncio.create_task(run_preview_pruner())
+    asyncio.create_task(run_progress_pruner())
+    asyncio.create_task(hls_packager.run_reaper())
+    asyncio.create_task(admission.run_sampler())
+    asyncio.create_task(job_store.run_keeper(recover_job))
+
+@app.on_event("startup")
+async def start_dependency_warm_up():
+    """Import yt-dlp and friends in the background instead of on the first request."""
+    loop = asyncio.get_event_loop()
+    future = loop.run_in_executor(None, warm_up)
+    future.add_done_callback(
+        lambda f: f.cancelled() or f.exception() is None
+        or logger.error(f"Dependency warm-up failed: {str(f.exception())}")
+    )
+
+async def run_progress_pruner(interval: float = PROGRESS_PRUNE_INTERVAL):
+    """Drop progress entries PROGRESS_RETENTION_SECONDS after their download ended, whatever ran it."""
+    ended = {}
+    while True:
+        now = time.monotonic()
+        for download_id, entry in list(download_progress.items()):
+            if entry.get('status') in PROGRESS_TERMINAL_STATUSES:
+                ended.setdefault(download_id, now)
             else:
-                raise HTTPException(status_code=400, detail="Invalid response format from Facebook API")
-        
-        elif platform == "tiktok":
-            formats = []
-            for quality, url in data.get("videos", {}).items():
-                formats.append(VideoFormat(
-                    resolution=quality,
-                    url=url,
-                    quality=quality,
-                    format_id=quality,
-                    ext="mp4"
-                ))
-            
-            return VideoResponse(
-                title=data.get("desc", ""),
-                thumbnail=data.get("cover", ""),
-                formats=formats,
-                platform=platform
-            )
-        
-        elif platform == "instagram":
-            formats = []
-            for quality, url in data.get("videos", {}).items():
-                formats.append(VideoFormat(
-                    resolution=quality,
-                    url=url,
-                    quality=quality,
-                    format_id=quality,
-                    ext="mp4"
-                ))
-            
-            return VideoResponse(
-                title=data.get("title", ""),
-                thumbnail=data.get("thumbnail", ""),
-                formats=formats,
-                platform=platform
-            )
-        
-        raise HTTPException(status_code=400, detail=f"Unsupported platform: {platform}")
-    except Exception as e:
-        logger.error(f"Error parsing RapidAPI response: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to parse video information")
+                ended.pop(download_id, None)
+        for download_id, since in list(ended.items()):
+            if download_id not in download_progress:
+                del ended[download_id]
+            elif now - since >= PROGRESS_RETENTION_SECONDS:
+                download_progress.pop(download_id, None)
+                del ended[download_id]
+        await asyncio.sleep(interval)
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe; answers as soon as the server is up, before warm-up finishes."""
+    return {"status": "ok", "warm": warmed.is_set()}
+
+@app.on_event("shutdown")
+async def stop_background_work():
+    """Don't leave ffmpeg remuxes or speculative downloads running after the worker exits."""
+    hls_packager.stop_all()
+    prefetcher.stop_all()
+    # Resumed jobs have no request holding the server open; checkpoint them for the next worker
+    for download_id in list(resumed_jobs):
+        jobs.cancel(download_id, REQUEST_ABORTED)
+    job_store.leave()
+
+def storage_full_response(error: StorageFull) -> JSONResponse:
+    """Tell the client to come back later when scratch space is exhausted."""
+    logger.warning(f"Rejecting job: {str(error)}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please try again shortly"},
+        headers={"Retry-After": "30"}
+    )
+
+def metrics_platform(platform: str) -> str:
+    """Map a client-supplied platform name onto a bounded set of metric labels."""
+    return platform if platform in SUPPORTED_PLATFORMS.values() else 'other'
+
+def get_platform_label(url: str) -> str:
+    """Platform name for metric labels, without failing on unknown hosts."""
+    try:
+        return get_platform(url)
+    except ValueError:
+        return 'other'
+
+def persisted_progress(job: dict) -> dict:
+    """A progress entry for a job known only from the job store."""
+    entry = dict(job['progress'] or {'progress': 0.0, 'speed': 'N/A', 'eta': 'N/A'})
+    # The last checkpoint may predate the outcome
+    if job['status'] in ('failed', 'cancelled', 'interrupted'):
+        entry['status'] = job['status']
+    if job['error']:
+        entry['error'] = job['error']
+    entry.setdefault('filename', job['filename'])
+    return entry
 
 @app.get("/api/progress/{download_id}")
 async def get_download_progress(download_id: str):
     """Get the progress of a download."""
     if download_id not in download_progress:
-        raise HTTPException(status_code=404, detail="Download not found")
-    return download_progress[download_id]
+        # The job may run in another worker, or have run before a restart
+        job = job_store.get(download_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Download not found")
+        return FastJSONResponse(persisted_progress(job))
+    # Polled every few hundred milliseconds by every open download page
+    return FastJSONResponse(download_progress[download_id])
 
 @app.post("/api/convert")
 async def convert_video(request: VideoRequest):
@@ -328,6 +352,10 @@ async def convert_video(request: VideoRequest):
         # Use yt-dlp for all platforms
         return await convert_youtube_video(request)
             
+    except Overloaded as e:
+        return overloaded_response(e)
+    except VideoUnavailable as e:
+        return unavailable_response(e)
     except HTTPException as he:
         logger.error(f"HTTP error in convert_video: {str(he)}")
         raise he
@@ -339,6 +367,8 @@ async def convert_video(request: VideoRequest):
 @app.get("/api/formats")
 async def get_formats(url: str):
     """Get available formats for a video URL."""
+    if not is_allowed_url(url):
+        return JSONResponse(status_code=400, content={"detail": INVALID_URL_MESSAGE})
     try:
         ydl_opts = {
             'quiet': True,
@@ -346,8 +376,12 @@ async def get_formats(url: str):
             'extract_flat': False
         }
         
+        # Off the event loop and in the info lane, like /api/info, so progress polls stay responsive
+        loop = asyncio.get_event_loop()
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+            async with admission.admit('info'):
+                with observe(EXTRACT_DURATION, platform=get_platform_label(url), endpoint='/api/formats'):
+                    info = await loop.run_in_executor(None, functools.partial(ydl.extract_info, url, download=False))
             if not info:
                 raise HTTPException(status_code=400, detail="Could not extract video information")
             
@@ -362,88 +396,391 @@ async def get_formats(url: str):
             
             return {"formats": standard_formats}
             
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error getting formats: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get video formats: {str(e)}")
 
-def compress_video(input_stream, quality):
-    input_file = None
-    output_file = None
+def compress_video(input_stream, quality, token: Optional[CancelToken] = None):
     try:
-        # Create temporary files with unique names
-        input_file = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
-        output_file = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
-        
-        # Close the files to release handles
-        input_file.close()
-        output_file.close()
-        
-        # Write input data to temporary file
-        with open(input_file.name, 'wb') as f:
-            f.write(input_stream.read())
-        
-        # Calculate bitrate based on quality
-        bitrate = {
-            1080: '5000k',
-            720: '2500k',
-            480: '1000k',
-            360: '750k',
-            240: '500k',
-            144: '250k'
-        }.get(quality, '1000k')
-        
-        # Run FFmpeg command
-        ffmpeg.input(input_file.name).output(
-            output_file.name,
-            vcodec='libx264',
-            acodec='aac',
-            video_bitrate=bitrate,
-            audio_bitrate='128k',
-            preset='medium',
-            movflags='faststart'
-        ).overwrite_output().run(quiet=True)
-        
-        # Read compressed output
-        with open(output_file.name, 'rb') as f:
-            compressed_data = f.read()
-        
-        if len(compressed_data) == 0:
-            raise ValueError("Compression resulted in empty file")
-        
-        return io.BytesIO(compressed_data)
+        with scratch.job_dir() as work_dir:
+            input_path = work_dir / 'input.mp4'
+            output_path = work_dir / 'output.mp4'
+
+            # Write input data to the job's scratch directory
+            with open(input_path, 'wb') as f:
+                f.write(input_stream.read())
+            
+            # Calculate bitrate based on quality
+            bitrate = {
+                1080: '5000k',
+                720: '2500k',
+                480: '1000k',
+                360: '750k',
+                240: '500k',
+                144: '250k'
+            }.get(quality, '1000k')
+            
+            # Run FFmpeg command
+            with span('ffmpeg-compress'), observe(FFMPEG_DURATION, operation='compress'):
+                run_ffmpeg(ffmpeg.input(str(input_path)).output(
+                    str(output_path),
+                    vcodec='libx264',
+                    acodec='aac',
+                    video_bitrate=bitrate,
+                    audio_bitrate='128k',
+                    preset='medium',
+                    movflags='faststart'
+                ).overwrite_output(), token)
+            
+            # Read compressed output
+            with open(output_path, 'rb') as f:
+                compressed_data = f.read()
+            
+            if len(compressed_data) == 0:
+                raise ValueError("Compression resulted in empty file")
+            
+            return io.BytesIO(compressed_data)
     
+    except JobCancelled:
+        raise
     except Exception as e:
         logger.error(f"Compression error: {str(e)}")
         # Return original video if compression fails
         input_stream.seek(0)
         return input_stream
-    
-    finally:
-        # Clean up temp files
+
+def parse_clip_range(start, end):
+    """Parse `start`/`end` (seconds or [hh:]mm:ss) into a (start, end) tuple in seconds."""
+    def to_seconds(value, name):
+        if value is None:
+            return None
+        seconds = value if isinstance(value, (int, float)) else yt_dlp.utils.parse_duration(str(value))
+        if seconds is None or seconds < 0:
+            raise ValueError(f"Invalid {name} time: {value}")
+        return float(seconds)
+
+    start_seconds = to_seconds(start, 'start') or 0.0
+    end_seconds = to_seconds(end, 'end')
+    if end_seconds is None:
+        end_seconds = float('inf')
+    if end_seconds <= start_seconds:
+        raise ValueError("Clip end must be after clip start")
+    return start_seconds, end_seconds
+
+def extract_audio(input_path: Path, output_path: Path, audio_format: str, source_codec: Optional[str],
+                  token: Optional[CancelToken] = None):
+    """Write the audio track of a download as `audio_format`, copying the stream when the codec allows.
+
+    When the extractor didn't report a codec, a stream copy is attempted
+    first and a transcode is only run if ffmpeg rejects it.
+    """
+    profile = AUDIO_FORMATS[audio_format]
+    attempts = []
+    if source_codec is None or source_codec == 'none' or source_codec.startswith(profile['copy_prefix']):
+        attempts.append(('copy', {'acodec': 'copy'}))
+    attempts.append(('transcode', {'acodec': profile['codec'], 'audio_bitrate': profile['bitrate']}))
+
+    for i, (mode, codec_opts) in enumerate(attempts):
+        if audio_format == 'm4a':
+            codec_opts['movflags'] = 'faststart'
+        operation = f'audio-{mode}-{audio_format}'
         try:
-            if input_file and os.path.exists(input_file.name):
-                os.unlink(input_file.name)
-            if output_file and os.path.exists(output_file.name):
-                os.unlink(output_file.name)
-        except Exception as e:
-            logger.error(f"Error cleaning up temp files: {str(e)}")
+            with span(f'ffmpeg-{operation}'), observe(FFMPEG_DURATION, operation=operation):
+                run_ffmpeg(ffmpeg.input(str(input_path)).output(
+                    str(output_path),
+                    vn=None,
+                    **codec_opts
+                ).overwrite_output(), token)
+        except ffmpeg.Error:
+            if i == len(attempts) - 1:
+                raise
+            logger.info(f"Stream copy to {audio_format} not possible, transcoding instead")
+            continue
+        if output_path.exists() and output_path.stat().st_size > 0:
+            return output_path
+
+    raise ValueError("Audio extraction resulted in empty file")
 
 @app.get("/api/download-progress/{filename}")
 async def get_download_progress(filename: str):
     """Get the progress of a download."""
-    # Find the download_id by filename
+    # Find the download_id by filename; the newest entry wins, so a retry isn't shadowed by an earlier attempt
     download_id = None
-    for key, value in download_progress.items():
+    for key, value in reversed(list(download_progress.items())):
         if value.get('filename') == filename:
             download_id = key
             break
     
     if not download_id:
-        return JSONResponse(
-            status_code=404,
-            content={"detail": "Download not found"}
-        )
-    return download_progress[download_id]
+        job = job_store.find_by_filename(filename)
+        if job is None:
+            return JSONResponse(
+                status_code=404,
+                content={"detail": "Download not found"}
+            )
+        return FastJSONResponse({**persisted_progress(job), 'download_id': job['download_id']})
+    return FastJSONResponse({**download_progress[download_id], 'download_id': download_id})
+
+class DownloadFailed(Exception):
+    """Raised when every download attempt came back without a usable file."""
+
+def run_download_job(url: str, platform: str, quality: int, mode: str, audio_format: str, clip, filename: str,
+                     download_id: str, cache_key: str, token: Optional[CancelToken] = None,
+                     endpoint: str = '/api/download', resume_dir: Optional[Path] = None):
+    """Resolve, download and retain one download, returning the stored result.
+
+    This blocks for the whole transfer, so callers run it in an executor.
+    Cancelling `token` aborts it at the next progress update, postprocessor
+    step or retry, and kills its ffmpeg subprocesses. The outcome is recorded
+    in the job store when the job was persisted; `resume_dir` continues the
+    partial files of an interrupted run.
+    """
+    token = token or CancelToken()
+    job_dir = None
+    keep_scratch = False
+    try:
+        handler = platforms.get(platform)
+
+        def probe():
+            recorder = ErrorRecorder(ytdlp_logger)
+            # Failures are logged rather than raised, so the recorder sees the message to classify
+            probe_opts = {'quiet': True, 'no_warnings': True, 'ignoreerrors': True, 'logger': recorder}
+            with yt_dlp.YoutubeDL(probe_opts) as ydl:
+                with span('format-probe'), observe(EXTRACT_DURATION, platform=metrics_platform(platform), endpoint=endpoint):
+                    info = ydl.extract_info(url, download=False)
+            if not info:
+                unavailable = negative_cache.record(url, recorder.last_error)
+                if unavailable is not None:
+                    raise unavailable
+            return info
+
+        ydl_opts = {
+            **handler.options(url),
+            'progress_hooks': [token.hook, functools.partial(progress_hook, download_id=download_id, filename=filename)],
+            'postprocessor_hooks': [token.hook, PostprocessorTimer()],
+        }
+
+        # Size estimate used to place the job on tmpfs or disk
+        expected_bytes = None
+
+        if mode == 'audio':
+            # Only the audio stream is transferred; there is nothing to merge or convert
+            ydl_opts['format'] = AUDIO_FORMATS[audio_format]['selector']
+            ydl_opts['format_sort'] = ['abr', 'asr', 'size']
+        else:
+            ydl_opts['format'], expected_bytes = handler.select_format(url, quality, probe)
+            ydl_opts.update(handler.postprocessing())
+
+        logger.info(f"Using format: {ydl_opts['format']}")
+        token.check()
+
+        if clip is not None:
+            # yt-dlp hands ranged downloads to ffmpeg with input seeking, so only
+            # the bytes (or, for HLS/DASH, the segments) covering the clip are fetched
+            ydl_opts['download_ranges'] = yt_dlp.utils.download_range_func(None, [clip])
+            ydl_opts['force_keyframes_at_cuts'] = False
+            logger.info(f"Clipping to {clip[0]}s-{clip[1]}s")
+
+        # Give the job its own scratch directory, refusing it if storage is short.
+        # Nothing in it is named after client input, so parallel jobs can't collide.
+        if resume_dir is not None and resume_dir.is_dir():
+            # yt-dlp continues the .part files left by the interrupted run
+            job_dir = scratch.adopt(resume_dir, download_id)
+        else:
+            job_dir = scratch.allocate(download_id, expected_bytes)
+        if job_store.attach_scratch(download_id, job_dir):
+            scratch.mark_resumable(job_dir)
+        output_path = job_dir / ('download.mp4' if mode == 'video' else 'download.audio')
+        ydl_opts['outtmpl'] = str(output_path)
+        ydl_opts['max_filesize'] = scratch.job_quota
+
+        # Download the video with retry mechanism
+        max_retries = 3
+        last_error = None
+        with track_job(metrics_platform(platform), endpoint):
+            for attempt in range(max_retries):
+                token.check()
+                # Remembers this attempt's extraction error, to tell unavailable videos from transient failures
+                recorder = ErrorRecorder(ytdlp_logger)
+                ydl_opts['logger'] = recorder
+                try:
+                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                        logger.info(f"Starting download attempt {attempt + 1} for URL: {url}")
+                    
+                        # First try to extract info without downloading
+                        with span('extract'), observe(EXTRACT_DURATION, platform=metrics_platform(platform), endpoint=endpoint):
+                            info = ydl.extract_info(url, download=False)
+                        if not info:
+                            # Retrying can't bring back a removed, private or blocked video
+                            unavailable = negative_cache.record(url, recorder.last_error)
+                            if unavailable is not None:
+                                raise unavailable
+                            raise Exception("Could not extract video information")
+                    
+                        logger.info(f"Video info extracted successfully: {info.get('title', 'Unknown title')}")
+                    
+                        # Download from the info just extracted instead of resolving the URL again
+                        with span('download'), observe(DOWNLOAD_DURATION, platform=metrics_platform(platform), endpoint=endpoint):
+                            ydl.process_ie_result(info, download=True)
+                    
+                        # Verify the downloaded file
+                        if output_path.exists():
+                            file_size = output_path.stat().st_size
+                            if file_size > 0:
+                                logger.info(f"Download successful. File size: {file_size} bytes")
+                                break
+                            else:
+                                logger.warning(f"Downloaded file is empty (attempt {attempt + 1})")
+                                output_path.unlink()  # Remove empty file
+                        else:
+                            logger.warning(f"Downloaded file not found (attempt {attempt + 1})")
+                
+                    if attempt < max_retries - 1:
+                        logger.info(f"Retrying download... (attempt {attempt + 2})")
+                        token.wait(2 ** attempt)  # Exponential backoff
+                    
+                except (yt_dlp.utils.DownloadCancelled, VideoUnavailable):
+                    raise
+                except Exception as e:
+                    last_error = str(e)
+                    logger.error(f"Download attempt {attempt + 1} failed: {last_error}")
+                    logger.error(f"Error type: {type(e).__name__}")
+                    logger.error(f"Error details: {traceback.format_exc()}")
+                    if attempt < max_retries - 1:
+                        token.wait(2 ** attempt)
+                    continue
+
+        # Check if file exists and is not empty after all attempts
+        if not output_path.exists() or output_path.stat().st_size == 0:
+            error_msg = f"Failed to download video after {max_retries} attempts"
+            if last_error:
+                error_msg += f": {last_error}"
+            logger.error(error_msg)
+            raise DownloadFailed(error_msg)
+
+        media_type = 'video/mp4'
+        if mode == 'audio':
+            output_path = extract_audio(output_path, job_dir / f'audio.{audio_format}', audio_format, info.get('acodec'), token)
+            media_type = AUDIO_FORMATS[audio_format]['media_type']
+
+        if filename is None:
+            # Callers without a name of their own (batch items) get the video's title
+            filename = f"{info.get('title') or 'video'}.{'mp4' if mode == 'video' else audio_format}"
+
+        # Retain the finished file so the client can resume or re-request it.
+        # Its metadata is written last, so other workers only ever see it complete.
+        with span('retain'):
+            stored = results.put(cache_key, download_id, output_path, safe_filename(filename), media_type)
+        logger.info(f"Successfully downloaded file. Size: {stored.size} bytes")
+        job_store.finish(download_id, 'finished')
+
+        return stored
+    except JobCancelled:
+        # Stopped by the server rather than the client: keep the partial files for a resume
+        keep_scratch = token.reason == REQUEST_ABORTED and job_store.finish(download_id, 'interrupted')
+        if not keep_scratch:
+            job_store.finish(download_id, 'cancelled')
+        raise
+    except Exception as e:
+        job_store.finish(download_id, 'failed', str(e))
+        raise
+    finally:
+        # Failed, cancelled and interrupted jobs never report 'finished'
+        progress_log_sampler.forget(download_id)
+        if keep_scratch:
+            scratch.detach(job_dir)
+        else:
+            scratch.release(job_dir)
+
+def schedule_prefetch(url: str, platform: str, info: dict):
+    """Start downloading the likeliest choice after an info lookup, when prefetching is on."""
+    if not prefetcher.enabled or not admission.has_capacity('download'):
+        return
+    # Same inputs as the frontend's POST /api/download, so the result cache key matches
+    quality = PREFETCH_QUALITY
+    cache_key = result_key(url, platform, quality)
+    filename = f"{info.get('title', 'video')}_{quality}p.mp4"
+    expected_bytes = index_formats(info.get('formats')).expected_bytes(quality)
+    prefetcher.schedule(cache_key, expected_bytes, functools.partial(
+        run_download_job, url, platform, quality, 'video', None, None, filename,
+        generate_download_id(url), cache_key, endpoint='prefetch'
+    ))
+
+async def wait_for_persisted_job(request: Request, cache_key: str):
+    """Wait for a running or resuming job producing `cache_key` in any worker, instead of duplicating it.
+
+    Returns the stored result, or None once no such job is active or after
+    JOB_WAIT_MAX_SECONDS, so a job stuck in 'running' can't hold requests forever.
+    """
+    if job_store.active(cache_key) is None:
+        return None
+    JOB_RECOVERIES.labels(outcome='attached').inc()
+    logger.info(f"Waiting for an in-progress download of {cache_key[:12]}")
+    deadline = time.monotonic() + JOB_WAIT_MAX_SECONDS
+    while True:
+        if time.monotonic() >= deadline:
+            logger.warning(f"Gave up waiting for the download of {cache_key[:12]}, running it here")
+            return None
+        await asyncio.sleep(JOB_WAIT_POLL_SECONDS)
+        if results.has(cache_key):
+            return results.lookup(cache_key)
+        if job_store.active(cache_key) is None:
+            return None
+        if await request.is_disconnected():
+            raise ClientDisconnected()
+
+def recover_job(job: dict):
+    """Resume a job taken over from a dead worker, or fail it cleanly if it was retried enough."""
+    download_id = job['download_id']
+    if job['resumes'] > JOB_MAX_RESUMES or time.time() - job['created'] > JOB_RESUME_MAX_AGE:
+        logger.warning(f"Giving up on interrupted download {download_id}")
+        job_store.finish(download_id, 'failed', "Interrupted by a server restart, please try again")
+        if job['scratch_dir']:
+            scratch.release(Path(job['scratch_dir']))
+        JOB_RECOVERIES.labels(outcome='failed').inc()
+        return
+    task = asyncio.create_task(resume_job(job))
+    resumed_jobs[download_id] = task
+
+async def resume_job(job: dict):
+    """Run an interrupted job to completion in the background; its result lands in the result store."""
+    download_id = job['download_id']
+    params = job['params']
+    download_progress[download_id] = job['progress'] or {
+        'status': 'starting', 'progress': 0.0, 'speed': 'N/A', 'eta': 'N/A', 'filename': params['filename']
+    }
+    resume_dir = Path(job['scratch_dir']) if job['scratch_dir'] else None
+    token = jobs.start(download_id)
+    loop = asyncio.get_event_loop()
+    logger.info(f"Resuming interrupted download {download_id} (resume {job['resumes']})")
+    background_started()
+    try:
+        # Resumes queue like any other download, so a restart can't flood the server
+        async with admission.admit('download'):
+            await loop.run_in_executor(None, functools.partial(
+                run_download_job, params['url'], params['platform'], params['quality'], params['mode'],
+                params['audio_format'], tuple(params['clip']) if params['clip'] else None, params['filename'],
+                download_id, job['cache_key'], token, endpoint='resume', resume_dir=resume_dir
+            ))
+        JOB_RECOVERIES.labels(outcome='resumed').inc()
+    except Overloaded as e:
+        job_store.finish(download_id, 'failed', f"Server is busy: {e.reason}")
+        scratch.release(resume_dir)
+        JOB_RECOVERIES.labels(outcome='failed').inc()
+    except asyncio.CancelledError:
+        token.cancel(REQUEST_ABORTED)
+        raise
+    except JobCancelled:
+        logger.info(f"Resumed download {download_id} stopped: {token.reason}")
+    except Exception as e:
+        logger.warning(f"Resumed download {download_id} did not complete: {str(e)}")
+        JOB_RECOVERIES.labels(outcome='failed').inc()
+    finally:
+        background_finished()
+        jobs.finish(download_id)
+        resumed_jobs.pop(download_id, None)
 
 @app.post("/api/download")
 async def download_video(request: Request):
@@ -454,12 +791,77 @@ async def download_video(request: Request):
         filename = data.get('filename', 'video.mp4')
         quality = data.get('quality', 1080)
         platform = data.get('platform', 'youtube')
+        mode = data.get('mode', 'video')
+        audio_format = data.get('audio_format', 'm4a')
+        clip_start = data.get('start')
+        clip_end = data.get('end')
 
         if not url:
             return JSONResponse(
                 status_code=400,
                 content={"detail": "URL is required"}
             )
+        if not is_allowed_url(url):
+            return JSONResponse(
+                status_code=400,
+                content={"detail": INVALID_URL_MESSAGE}
+            )
+        if mode not in ('video', 'audio'):
+            return JSONResponse(
+                status_code=400,
+                content={"detail": "mode must be 'video' or 'audio'"}
+            )
+        if mode == 'audio':
+            if audio_format not in AUDIO_FORMATS:
+                return JSONResponse(
+                    status_code=400,
+                    content={"detail": f"audio_format must be one of: {', '.join(AUDIO_FORMATS)}"}
+                )
+            filename = f"{Path(safe_filename(filename)).stem}.{audio_format}"
+        clip = None
+        if clip_start is not None or clip_end is not None:
+            try:
+                clip = parse_clip_range(clip_start, clip_end)
+            except ValueError as e:
+                return JSONResponse(
+                    status_code=400,
+                    content={"detail": str(e)}
+                )
+
+        # Serve a retained result for the same request instead of redoing the work
+        cache_key = result_key(url, platform, quality) if mode == 'video' else result_key(url, platform, mode, audio_format)
+        if clip is not None:
+            cache_key = result_key(cache_key, clip)
+        cached = results.lookup(cache_key)
+        if cached is not None:
+            logger.info(f"Serving retained result {cached.download_id} for {url}")
+            download_progress[cached.download_id] = {
+                'status': 'finished',
+                'progress': 100.0,
+                'speed': 'N/A',
+                'eta': 'N/A',
+                'filename': filename
+            }
+            return serve_result(request, cached)
+
+        # A speculative prefetch of this exact job may already be running
+        stored = await prefetcher.claim(cache_key)
+        if stored is not None:
+            return serve_result(request, stored)
+
+        # So may the same download for another client, or one resumed after a restart
+        try:
+            stored = await wait_for_persisted_job(request, cache_key)
+        except ClientDisconnected:
+            return Response(status_code=499)
+        if stored is not None:
+            return serve_result(request, stored)
+
+        # Fail fast for a video that just failed as removed, private or blocked
+        try:
+            negative_cache.check(url)
+        except VideoUnavailable as e:
+            return unavailable_response(e)
 
         # Generate a unique download ID
         download_id = generate_download_id(url)
@@ -468,200 +870,55 @@ async def download_video(request: Request):
         # Initialize progress tracking
         download_progress[download_id] = {
             'status': 'starting',
-            'progress': '0',
+            'progress': 0.0,
             'speed': 'N/A',
             'eta': 'N/A',
             'filename': filename
         }
 
-        # Create a temporary directory for downloads
-        temp_dir = Path("temp_downloads")
-        temp_dir.mkdir(exist_ok=True)
-        output_path = temp_dir / filename
-
-        # Configure yt-dlp options with improved settings
-        ydl_opts = {
-            'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-            'outtmpl': str(output_path),
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'force_generic_extractor': False,
-            'socket_timeout': 30,
-            'retries': 10,
-            'fragment_retries': 10,
-            'file_access_retries': 10,
-            'extractor_retries': 10,
-            'ignoreerrors': True,
-            'no_check_certificate': True,
-            'prefer_insecure': True,
-            'legacyserverconnect': True,
-            'source_address': '0.0.0.0',
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            },
-            'postprocessors': [{
-                'key': 'FFmpegVideoConvertor',
-                'preferedformat': 'mp4',
-            }],
-            'progress_hooks': [progress_hook],
-            'verbose': True,
-            'logger': logger,
-            'format_sort': ['res', 'fps', 'codec', 'size', 'br', 'asr', 'ext'],
-            'merge_output_format': 'mp4',
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['web'],
-                    'player_skip': ['webpage', 'config', 'js'],
-                    'formats': 'missing_pot'
-                }
-            }
-        }
-
-        # Platform-specific options
-        if platform == 'youtube':
-            # Define allowed qualities
-            allowed_qualities = [144, 240, 360, 720, 1080]
-            
-            # First try to get available formats
-            with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
-                try:
-                    info = ydl.extract_info(url, download=False)
-                    if not info:
-                        raise Exception("Could not extract video information")
-                    
-                    # Get available formats
-                    formats = info.get('formats', [])
-                    available_heights = [f.get('height', 0) for f in formats if f.get('height')]
-                    
-                    if available_heights:
-                        # Find the closest allowed quality to requested quality
-                        closest_height = min(allowed_qualities, key=lambda x: abs(x - quality))
-                        # For YouTube Shorts, use a more flexible format selection
-                        if 'shorts' in url:
-                            ydl_opts['format'] = f'best[height<={closest_height}]'
-                        else:
-                            ydl_opts['format'] = f'bestvideo[height={closest_height}]+bestaudio/best[height={closest_height}]'
-                        logger.info(f"Using closest allowed quality: {closest_height}p")
-                    else:
-                        # Fallback to best available format
-                        ydl_opts['format'] = 'best'
-                        logger.info("Using best available format")
-                except Exception as e:
-                    logger.warning(f"Error getting formats: {str(e)}")
-                    # Fallback to default format
-                    ydl_opts['format'] = 'best'
-
-            # Add specific options for YouTube Shorts
-            if 'shorts' in url:
-                ydl_opts['extractor_args'] = {
-                    'youtube': {
-                        'player_client': ['web'],
-                        'player_skip': ['webpage', 'config', 'js'],
-                        'formats': 'missing_pot',
-                        'skip_dash_manifest': True
-                    }
-                }
-
-        elif platform == 'tiktok':
-            ydl_opts['format'] = 'best'
-            ydl_opts['extractor_args'] = {
-                'tiktok': {
-                    'download_timeout': 30,
-                    'retries': 10
-                }
-            }
-        elif platform == 'instagram':
-            ydl_opts['format'] = 'best'
-            ydl_opts['extractor_args'] = {
-                'instagram': {
-                    'download_timeout': 30,
-                    'retries': 10
-                }
-            }
-
-        logger.info(f"Using format: {ydl_opts['format']}")
-
-        # Download the video with retry mechanism
-        max_retries = 3
-        last_error = None
-        for attempt in range(max_retries):
-            try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    logger.info(f"Starting download attempt {attempt + 1} for URL: {url}")
-                    
-                    # First try to extract info without downloading
-                    info = ydl.extract_info(url, download=False)
-                    if not info:
-                        raise Exception("Could not extract video information")
-                    
-                    logger.info(f"Video info extracted successfully: {info.get('title', 'Unknown title')}")
-                    
-                    # Now try to download
-                    ydl.download([url])
-                    
-                    # Verify the downloaded file
-                    if output_path.exists():
-                        file_size = output_path.stat().st_size
-                        if file_size > 0:
-                            logger.info(f"Download successful. File size: {file_size} bytes")
-                            break
-                        else:
-                            logger.warning(f"Downloaded file is empty (attempt {attempt + 1})")
-                            output_path.unlink()  # Remove empty file
-                    else:
-                        logger.warning(f"Downloaded file not found (attempt {attempt + 1})")
-                
-                if attempt < max_retries - 1:
-                    logger.info(f"Retrying download... (attempt {attempt + 2})")
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                    
-            except Exception as e:
-                last_error = str(e)
-                logger.error(f"Download attempt {attempt + 1} failed: {last_error}")
-                logger.error(f"Error type: {type(e).__name__}")
-                logger.error(f"Error details: {traceback.format_exc()}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)
-                continue
-
-        # Check if file exists and is not empty after all attempts
-        if not output_path.exists() or output_path.stat().st_size == 0:
-            error_msg = f"Failed to download video after {max_retries} attempts"
-            if last_error:
-                error_msg += f": {last_error}"
-            logger.error(error_msg)
+        # The job stops as soon as the client goes away or cancels it through the API
+        token = jobs.start(download_id)
+        try:
+            async with admission.admit('download'):
+                # Checkpointed so another worker can resume it if this one goes away
+                job_store.create(download_id, cache_key, filename, {
+                    'url': url, 'platform': platform, 'quality': quality, 'mode': mode,
+                    'audio_format': audio_format, 'clip': clip, 'filename': filename
+                }, download_progress[download_id])
+                stored = await run_until_disconnect(
+                    request, token, run_download_job, url, platform, quality, mode, audio_format, clip, filename,
+                    download_id, cache_key, token
+                )
+        except Overloaded as e:
+            download_progress.pop(download_id, None)
+            return overloaded_response(e)
+        except ClientDisconnected:
+            logger.info(f"Client disconnected, cancelled download {download_id}")
+            # The job store keeps the outcome for polls; the entry would only shadow a retry
+            download_progress.pop(download_id, None)
+            return Response(status_code=499)
+        except JobCancelled as e:
+            logger.info(f"Download {download_id} cancelled: {token.reason}")
+            download_progress.pop(download_id, None)
             return JSONResponse(
-                status_code=500,
-                content={"detail": error_msg}
+                status_code=409,
+                content={"detail": "Download was cancelled"}
             )
-
-        # Read the file and return it
-        file_content = output_path.read_bytes()
-        file_size = len(file_content)
-        
-        if file_size == 0:
-            error_msg = "Downloaded file is empty"
-            logger.error(error_msg)
+        except StorageFull as e:
+            return storage_full_response(e)
+        except VideoUnavailable as e:
+            download_progress[download_id]['status'] = 'failed'
+            return unavailable_response(e)
+        except DownloadFailed as e:
             return JSONResponse(
                 status_code=500,
-                content={"detail": error_msg}
+                content={"detail": str(e)}
             )
-            
-        logger.info(f"Successfully downloaded file. Size: {file_size} bytes")
-        
-        # Clean up the temporary file
-        output_path.unlink()
-
-        # Return the file with proper headers
-        return Response(
-            content=file_content,
-            media_type="video/mp4",
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Content-Length": str(file_size)
-            }
-        )
+        finally:
+            jobs.finish(download_id)
+
+        # Stream the file, honouring Range requests
+        return serve_result(request, stored)
 
     except Exception as e:
         error_msg = f"Server error: {str(e)}"
@@ -672,9 +929,101 @@ async def download_video(request: Request):
             content={"detail": error_msg}
         )
 
+@app.post("/api/download/{download_id}/cancel")
+async def cancel_download(download_id: str):
+    """Stop a running download; its progress entry reports `cancelled`."""
+    if not jobs.cancel(download_id, "cancelled by client"):
+        raise HTTPException(status_code=404, detail="No running download with that id")
+    if download_id in download_progress:
+        download_progress[download_id]['status'] = 'cancelled'
+    return {"download_id": download_id, "status": "cancelled"}
+
+@app.get("/api/download/{download_id}")
+async def get_download_result(download_id: str, request: Request):
+    """Serve a retained download, with Range/If-Range support for resuming and seeking."""
+    stored = results.get(download_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Download not found or expired")
+    return serve_result(request, stored)
+
+@app.get("/api/thumbnail/{video_id}")
+async def get_video_thumbnail(video_id: str, request: Request, w: int = 320):
+    """Serve a resized, cached copy of a video's thumbnail."""
+    cached = video_info_cache.get(video_id)
+    if not cached or not cached.get('thumbnail'):
+        raise HTTPException(status_code=404, detail="Unknown video; request /api/info first")
+    try:
+        data, etag = await get_thumbnail(video_id, cached['thumbnail'], w)
+    except Exception as e:
+        logger.warning(f"Thumbnail unavailable for {video_id}: {str(e)}")
+        raise HTTPException(status_code=502, detail="Thumbnail unavailable")
+
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=86400'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type='image/jpeg', headers=headers)
+
+@app.get("/api/preview/{video_id}")
+async def get_video_preview(video_id: str, frames: int = 10, w: int = 160):
+    """Serve a sprite of evenly spaced keyframes for the quality picker."""
+    cached = video_info_cache.get(video_id)
+    if not cached:
+        raise HTTPException(status_code=404, detail="Unknown video; request /api/info first")
+    try:
+        with span("preview"):
+            sprite, layout = await get_preview_sprite(video_id, cached, frames, w)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ffmpeg.Error as e:
+        logger.warning(f"Preview failed for {video_id}: {truncate(e.stderr.decode(errors='replace') if e.stderr else str(e))}")
+        raise HTTPException(status_code=502, detail="Could not read the video stream")
+
+    headers = {f"X-Sprite-{key.replace('_', '-').title()}": str(value) for key, value in layout.items()}
+    headers['Cache-Control'] = 'public, max-age=86400'
+    return FileResponse(sprite, media_type='image/jpeg', headers=headers)
+
+@app.get("/api/stream/{video_id}/{format_id}/{name}")
+async def stream_preview(video_id: str, format_id: str, name: str):
+    """HLS preview of a format, remuxed to fMP4 segments on demand; start with index.m3u8."""
+    if name != PLAYLIST_NAME:
+        segment = hls_packager.segment(video_id, format_id, name)
+        if segment is None:
+            raise HTTPException(status_code=404, detail="Segment not found")
+        return FileResponse(
+            segment,
+            media_type='video/mp4' if name.endswith('.mp4') else 'video/iso.segment',
+            headers={'Cache-Control': 'public, max-age=3600, immutable'}
+        )
+
+    try:
+        with span("hls-start"):
+            playlist = await hls_packager.playlist(video_id, format_id, video_info_cache.get(video_id))
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Unknown video; request /api/info first")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except HlsBusy:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Too many previews are playing, please try again shortly"},
+            headers={"Retry-After": "15"}
+        )
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except RuntimeError as e:
+        logger.warning(f"HLS remux failed for {video_id}/{format_id}: {truncate(str(e))}")
+        raise HTTPException(status_code=502, detail="Could not read the video stream")
+
+    # The playlist grows while the remux runs, so players must keep reloading it.
+    cache_control = 'public, max-age=3600' if '#EXT-X-ENDLIST' in playlist else 'no-cache'
+    return Response(content=playlist, media_type='application/vnd.apple.mpegurl',
+                    headers={'Cache-Control': cache_control})
+
 async def convert_youtube_video(request: VideoRequest):
     """Handle YouTube video conversion using yt-dlp."""
     try:
+        negative_cache.check(request.url)
+        recorder = ErrorRecorder(ytdlp_logger)
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
@@ -703,236 +1052,87 @@ async def convert_youtube_video(request: VideoRequest):
             'socket_timeout': 30,
             'http_headers': {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+            },
+            'logger': recorder
         }
 
+        loop = asyncio.get_event_loop()
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(request.url, download=False)
+            # Extraction runs off the event loop so progress polls are answered meanwhile
+            async with admission.admit('info'):
+                with span('extract'), observe(EXTRACT_DURATION, platform=get_platform_label(request.url), endpoint='/api/convert'):
+                    info = await loop.run_in_executor(None, functools.partial(ydl.extract_info, request.url, download=False))
             if not info:
+                unavailable = negative_cache.record(request.url, recorder.last_error)
+                if unavailable is not None:
+                    raise unavailable
                 raise HTTPException(status_code=400, detail="Could not extract video information")
 
             formats = []
-            if 'formats' in info:
-                # Create a dictionary to store unique resolutions
-                unique_formats = {}
-                
-                for f in info['formats']:
-                    if f.get('vcodec') != 'none' and f.get('acodec') != 'none':
-                        height = f.get('height', 0)
-                        if height and height not in unique_formats:
-                            unique_formats[height] = f
-
-                # Convert dictionary to list and sort by height
-                for height, f in sorted(unique_formats.items(), reverse=True):
-                    formats.append(VideoFormat(
-                        resolution=f"{height}p",
-                        url=f.get('url', ''),
-                        size=f.get('filesize_str'),
-                        quality=f"{height}p",
-                        format_id=f"{height}p"  # Use resolution as format_id
-                    ))
-
-            return VideoResponse(
-                title=info.get('title', ''),
-                thumbnail=info.get('thumbnail', ''),
-                duration=str(info.get('duration', '')),
-                formats=formats,
-                platform="youtube"
-            )
-
+            # One entry per resolution with both audio and video, tallest first
+            for height, f in index_formats(info.get('formats')).first_per_height(progressive=True):
+                entry = {
+                    'resolution': f"{height}p",
+                    'size': f.get('filesize_str'),
+                    'quality': f"{height}p",
+                    'format_id': f"{height}p"  # Use resolution as format_id
+                }
+                if request.include_urls:
+                    entry['url'] = f.get('url', '')
+                formats.append(entry)
+
+            cached = await update_video_info(request.url, info, get_platform_label(request.url))
+            schedule_prefetch(request.url, 'youtube', info)
+
+            # Shaped like VideoResponse, but serialized directly instead of through the model
+            return FastJSONResponse(select_fields({
+                'title': info.get('title', ''),
+                'thumbnail': info.get('thumbnail', ''),
+                'duration': str(info.get('duration', '')),
+                'formats': formats,
+                'platform': "youtube",
+                'download_id': None,
+                'video_id': cached.get('video_id')
+            }, parse_fields(request.fields)))
+
+    except (Overloaded, VideoUnavailable):
+        raise
     except Exception as e:
         logger.error(f"Error in convert_youtube_video: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
 
-async def download_youtube_video(request: VideoDownloadRequest):
-    temp_dir = None
-    try:
-        temp_dir = tempfile.mkdtemp()
-        
-        ydl_opts = {
-            'format': f'bestvideo[height<={request.quality}]+bestaudio/best[height<={request.quality}]',
-            'merge_output_format': 'mp4',
-            'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Download the video
-            info = ydl.extract_info(request.url, download=True)
-            if not info:
-                raise HTTPException(status_code=400, detail="Could not extract video information")
-            
-            # Get the downloaded file path
-            filename = ydl.prepare_filename(info)
-            if not os.path.exists(filename):
-                raise HTTPException(status_code=400, detail="Downloaded file not found")
-            
-            # Check file size
-            file_size = os.path.getsize(filename)
-            if file_size == 0:
-                raise HTTPException(status_code=400, detail="Downloaded file is empty")
-            
-            # Create safe filename with proper encoding
-            safe_title = ''.join(c for c in info.get('title', '') if c.isalnum() or c in (' ', '-', '_')).strip()
-            safe_title = safe_title.replace(' ', '_')
-            output_filename = request.fileName or f"{safe_title}_{request.quality}p.mp4"
-            
-            # Read file into memory
-            with open(filename, 'rb') as f:
-                video_data = f.read()
-            
-            if len(video_data) == 0:
-                raise HTTPException(status_code=400, detail="Video data is empty")
-            
-            buffer = io.BytesIO(video_data)
-            
-            # Compress if requested
-            if request.compress:
-                try:
-                    compressed_buffer = compress_video(buffer, request.quality)
-                    if compressed_buffer.getbuffer().nbytes > 0:
-                        buffer = compressed_buffer
-                    else:
-                        logger.warning("Compression resulted in empty file, using original")
-                        buffer.seek(0)
-                except Exception as e:
-                    logger.error(f"Compression error: {str(e)}")
-                    buffer.seek(0)
-            
-            # Final size check
-            final_size = buffer.getbuffer().nbytes
-            if final_size == 0:
-                raise HTTPException(status_code=400, detail="Final video buffer is empty")
-            
-            # Return the video with properly encoded headers
-            return StreamingResponse(
-                buffer,
-                media_type="video/mp4",
-                headers={
-                    "Content-Disposition": f'attachment; filename="{output_filename.encode("ascii", "ignore").decode("ascii")}"',
-                    "Content-Type": "video/mp4",
-                    "Content-Length": str(final_size)
-                }
-            )
-            
-    except Exception as e:
-        logger.error(f"Error downloading video: {str(e)}")
-        logger.error(traceback.format_exc())
-        raise HTTPException(status_code=400, detail=f"Failed to download video: {str(e)}")
-    finally:
-        if temp_dir and os.path.exists(temp_dir):
-            try:
-                shutil.rmtree(temp_dir)
-            except Exception as e:
-                logger.error(f"Error cleaning up temp directory: {str(e)}")
-
-async def download_facebook_video(request: VideoDownloadRequest):
-    """Download Facebook video using yt-dlp."""
-    temp_dir = tempfile.mkdtemp()
-    try:
-        # First get video info without downloading
-        info_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'socket_timeout': 30,
-            'retries': 10,
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-        }
-        
-        with yt_dlp.YoutubeDL(info_opts) as ydl:
-            try:
-                # First get video info
-                info = ydl.extract_info(request.url, download=False)
-                if not info:
-                    raise HTTPException(status_code=400, detail="Could not extract video information")
-                
-                # Store thumbnail and title
-                thumbnail_url = info.get('thumbnail', '')
-                original_title = info.get('title', '')
-                
-                # Create safe filename from original title
-                safe_title = ''.join(c for c in original_title if c.isascii() and (c.isalnum() or c in (' ', '-', '_'))).strip()
-                safe_title = safe_title.replace(' ', '_')
-                if not safe_title:
-                    safe_title = 'facebook_video'
-                
-                # Configure download options
-                download_opts = {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'format': 'best',  # Always use best available format for Facebook
-                    'outtmpl': {
-                        'default': os.path.join(temp_dir, f"{safe_title}.%(ext)s")
-                    },
-                    'socket_timeout': 30,
-                    'retries': 10,
-                    'http_headers': {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                    }
-                }
-                
-                # Download the video
-                with yt_dlp.YoutubeDL(download_opts) as ydl_download:
-                    info = ydl_download.extract_info(request.url, download=True)
-                    filename = ydl_download.prepare_filename(info)
-                    
-                    if not os.path.exists(filename):
-                        raise HTTPException(status_code=404, detail="Video file not found after download")
-                    
-                    with open(filename, 'rb') as f:
-                        video_buffer = io.BytesIO(f.read())
-                    
-                    if request.compress:
-                        video_buffer = compress_video(video_buffer, request.quality)
-                    
-                    # Use the safe title for the output filename
-                    output_filename = f"{safe_title}.mp4"
-                    
-                    # Return the video with headers
-                    headers = {
-                        'Content-Disposition': f'attachment; filename="{quote(output_filename)}"',
-                        'Content-Type': 'video/mp4',
-                        'X-Video-Title': quote(original_title),
-                        'X-Video-Thumbnail': quote(thumbnail_url)
-                    }
-                    
-                    return StreamingResponse(
-                        video_buffer,
-                        media_type='video/mp4',
-                        headers=headers
-                    )
-                    
-            except Exception as e:
-                logger.error(f"Facebook download error: {str(e)}")
-                raise HTTPException(status_code=400, detail=f"Failed to download Facebook video: {str(e)}")
-    finally:
-        try:
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            logger.error(f"Error cleaning up temporary directory: {str(e)}")
-
 @app.post("/api/info")
 async def get_video_info(request: Request):
     try:
         data = await request.json()
         url = data.get('url')
+        fields = parse_fields(data.get('fields') or request.query_params.get('fields'))
+        include_urls = bool(data.get('include_urls'))
         
         if not url:
             return JSONResponse(
                 status_code=400,
                 content={"detail": "URL is required"}
             )
+        if not is_allowed_url(url):
+            return JSONResponse(
+                status_code=400,
+                content={"detail": INVALID_URL_MESSAGE}
+            )
 
         # Generate a unique download ID
         download_id = generate_download_id(url)
         logger.info(f"Fetching info for URL: {url} with ID: {download_id}")
 
+        # Fail fast for a video that just failed as removed, private or blocked
+        try:
+            negative_cache.check(url)
+        except VideoUnavailable as e:
+            return unavailable_response(e)
+
         # Configure yt-dlp options
+        recorder = ErrorRecorder(ytdlp_logger)
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
@@ -950,40 +1150,42 @@ async def get_video_info(request: Request):
             'source_address': '0.0.0.0',
             'http_headers': {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+            },
+            'logger': recorder
         }
 
-        # Extract video information
+        # Extract video information off the event loop so progress polls are answered meanwhile
+        loop = asyncio.get_event_loop()
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             try:
-                info = ydl.extract_info(url, download=False)
+                async with admission.admit('info'):
+                    with span('extract'), observe(EXTRACT_DURATION, platform=get_platform_label(url), endpoint='/api/info'):
+                        info = await loop.run_in_executor(None, functools.partial(ydl.extract_info, url, download=False))
                 if not info:
+                    unavailable = negative_cache.record(url, recorder.last_error)
+                    if unavailable is not None:
+                        return unavailable_response(unavailable)
                     raise Exception("Could not extract video information")
 
-                # Determine platform
-                platform = 'youtube'  # default
-                if 'tiktok.com' in url:
-                    platform = 'tiktok'
-                elif 'instagram.com' in url:
-                    platform = 'instagram'
-                elif 'facebook.com' in url:
-                    platform = 'facebook'
+                detected = platforms.detect(url)
+                platform = detected.name if detected else 'youtube'
 
-                # Get available formats
+                # Get available formats, tallest first
                 formats = []
-                if 'formats' in info:
-                    for f in info['formats']:
-                        if f.get('format_note') and f.get('ext') == 'mp4':
-                            formats.append({
-                                'format_id': f['format_id'],
-                                'ext': f['ext'],
-                                'format_note': f['format_note'],
-                                'filesize': f.get('filesize', 0),
-                                'height': f.get('height', 0)
-                            })
-
-                # Sort formats by height (quality)
-                formats.sort(key=lambda x: x['height'], reverse=True)
+                for f in index_formats(info.get('formats')).select(ext='mp4', noted=True):
+                    entry = {
+                        'format_id': f['format_id'],
+                        'ext': f['ext'],
+                        'format_note': f['format_note'],
+                        'filesize': f.get('filesize', 0),
+                        'height': f.get('height', 0)
+                    }
+                    if include_urls:
+                        entry['url'] = f.get('url')
+                    formats.append(entry)
+
+                cached = await update_video_info(url, info, platform)
+                schedule_prefetch(url, platform, info)
 
                 # Prepare response
                 response_data = {
@@ -993,12 +1195,15 @@ async def get_video_info(request: Request):
                     'formats': formats,
                     'platform': platform,
                     'url': url,
-                    'download_id': download_id
+                    'download_id': download_id,
+                    'video_id': cached.get('video_id')
                 }
 
                 logger.info(f"Successfully extracted info for {url}")
-                return JSONResponse(content=response_data)
+                return FastJSONResponse(select_fields(response_data, fields))
 
+            except Overloaded as e:
+                return overloaded_response(e)
             except Exception as e:
                 error_msg = f"Error extracting video info: {str(e)}"
                 logger.error(error_msg)
@@ -1017,134 +1222,30 @@ async def get_video_info(request: Request):
             content={"detail": error_msg}
         )
 
-async def update_video_info(url: str, info: dict):
-    """Update video info in memory cache."""
+async def update_video_info(url: str, info: dict, platform: Optional[str] = None):
+    """Update video info in memory cache, keyed by the extractor's video ID."""
     try:
-        # Generate a unique key based on the URL
-        video_id = url.split('v=')[-1] if 'v=' in url else url.split('/')[-1]
-        cache_key = f"video_info_{video_id}"
+        video_id = info.get('id') or (url.split('v=')[-1] if 'v=' in url else url.split('/')[-1])
         
-        # Store in memory cache
-        video_info_cache[cache_key] = {
+        # Store in memory cache; re-inserting moves the entry to the end
+        video_info_cache.pop(video_id, None)
+        video_info_cache[video_id] = {
+            "video_id": video_id,
+            "url": url,
             "title": info.get("title", ""),
             "thumbnail": info.get("thumbnail", ""),
             "duration": info.get("duration", ""),
             "formats": info.get("formats", []),
-            "platform": info.get("platform", "unknown")
+            "platform": platform or info.get("platform", "unknown")
         }
-        return video_info_cache[cache_key]
+        # Dicts keep insertion order, so the first key is the least recently stored
+        while len(video_info_cache) > VIDEO_INFO_CACHE_MAX:
+            video_info_cache.pop(next(iter(video_info_cache)))
+        return video_info_cache[video_id]
     except Exception as e:
         logger.error(f"Error updating video info: {str(e)}")
         return info
 
-async def download_instagram_video(request: VideoDownloadRequest):
-    """Download Instagram video using yt-dlp."""
-    temp_dir = tempfile.mkdtemp()
-    try:
-        ydl_opts = {
-            'format': request.format,  # Use the format from the request
-            'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'progress_hooks': [progress_hook],
-            'verbose': True
-        }
-        
-        logger.info(f"Starting Instagram video download for URL: {request.url}")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(request.url, download=True)
-                if not info:
-                    raise HTTPException(status_code=400, detail="Could not extract video information")
-                
-                filename = ydl.prepare_filename(info)
-                if not os.path.exists(filename):
-                    raise HTTPException(status_code=404, detail="Video file not found after download")
-                
-                logger.info(f"Instagram video downloaded successfully: {filename}")
-                
-                with open(filename, 'rb') as f:
-                    video_buffer = io.BytesIO(f.read())
-                
-                if request.compress:
-                    logger.info("Compressing Instagram video...")
-                    video_buffer = compress_video(video_buffer, request.quality)
-                
-                return StreamingResponse(
-                    video_buffer,
-                    media_type='video/mp4',
-                    headers={
-                        'Content-Disposition': f'attachment; filename="{quote(info["title"])}.mp4"'
-                    }
-                )
-                
-            except yt_dlp.utils.DownloadError as e:
-                logger.error(f"Instagram download error: {str(e)}")
-                raise HTTPException(status_code=400, detail=f"Failed to download Instagram video: {str(e)}")
-            except Exception as e:
-                logger.error(f"Unexpected error during Instagram download: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
-    finally:
-        try:
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            logger.error(f"Error cleaning up temp directory: {str(e)}")
-
-async def download_tiktok_video(request: VideoDownloadRequest):
-    """Download TikTok video using yt-dlp."""
-    temp_dir = tempfile.mkdtemp()
-    try:
-        ydl_opts = {
-            'format': f'bestvideo[height<={request.quality}]+bestaudio/best[height<={request.quality}]',
-            'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'progress_hooks': [progress_hook],
-            'verbose': True
-        }
-        
-        logger.info(f"Starting TikTok video download for URL: {request.url}")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(request.url, download=True)
-                if not info:
-                    raise HTTPException(status_code=400, detail="Could not extract video information")
-                
-                filename = ydl.prepare_filename(info)
-                if not os.path.exists(filename):
-                    raise HTTPException(status_code=404, detail="Video file not found after download")
-                
-                logger.info(f"TikTok video downloaded successfully: {filename}")
-                
-                with open(filename, 'rb') as f:
-                    video_buffer = io.BytesIO(f.read())
-                
-                if request.compress:
-                    logger.info("Compressing TikTok video...")
-                    video_buffer = compress_video(video_buffer, request.quality)
-                
-                return StreamingResponse(
-                    video_buffer,
-                    media_type='video/mp4',
-                    headers={
-                        'Content-Disposition': f'attachment; filename="{quote(info["title"])}.mp4"'
-                    }
-                )
-                
-            except yt_dlp.utils.DownloadError as e:
-                logger.error(f"TikTok download error: {str(e)}")
-                raise HTTPException(status_code=400, detail=f"Failed to download TikTok video: {str(e)}")
-            except Exception as e:
-                logger.error(f"Unexpected error during TikTok download: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
-    finally:
-        try:
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            logger.error(f"Error cleaning up temporary directory: {str(e)}")
-
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8080))
@@ -0,0 +1,226 @@
+import time
+from contextlib import contextmanager
+
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from tracing import add_span
+
+# Buckets tuned for a pipeline where a single stage can take anywhere from a
+# few milliseconds (cached lookups) to several minutes (long downloads).
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+THROUGHPUT_BUCKETS = (
+    64 * 1024, 256 * 1024, 512 * 1024, 1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2,
+    10 * 1024 ** 2, 25 * 1024 ** 2, 50 * 1024 ** 2, 100 * 1024 ** 2
+)
+
+REQUEST_DURATION = Histogram(
+    'vidconvertly_http_request_duration_seconds',
+    'Time from receiving a request until its last response byte was sent',
+    ['endpoint', 'method', 'status'],
+    buckets=STAGE_BUCKETS
+)
+RESPONSE_SEND_DURATION = Histogram(
+    'vidconvertly_response_send_duration_seconds',
+    'Time spent sending the response body to the client',
+    ['endpoint'],
+    buckets=STAGE_BUCKETS
+)
+EXTRACT_DURATION = Histogram(
+    'vidconvertly_extract_duration_seconds',
+    'Time spent in yt-dlp extract_info',
+    ['platform', 'endpoint'],
+    buckets=STAGE_BUCKETS
+)
+DOWNLOAD_DURATION = Histogram(
+    'vidconvertly_download_duration_seconds',
+    'Time spent transferring media from the platform',
+    ['platform', 'endpoint'],
+    buckets=STAGE_BUCKETS
+)
+DOWNLOAD_THROUGHPUT = Histogram(
+    'vidconvertly_download_throughput_bytes_per_second',
+    'Average transfer rate of each finished yt-dlp download',
+    ['platform'],
+    buckets=THROUGHPUT_BUCKETS
+)
+DOWNLOADED_BYTES = Counter(
+    'vidconvertly_downloaded_bytes_total',
+    'Bytes transferred from platforms by yt-dlp',
+    ['platform']
+)
+POSTPROCESS_DURATION = Histogram(
+    'vidconvertly_postprocess_duration_seconds',
+    'Time spent in yt-dlp postprocessors (merge, convert, ...)',
+    ['platform', 'postprocessor'],
+    buckets=STAGE_BUCKETS
+)
+FFMPEG_DURATION = Histogram(
+    'vidconvertly_ffmpeg_duration_seconds',
+    'Time spent in ffmpeg invocations made by the backend itself',
+    ['operation'],
+    buckets=STAGE_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    'vidconvertly_cache_requests_total',
+    'Cache lookups by cache name and result',
+    ['cache', 'result']
+)
+REQUEST_PEAK_MEMORY = Histogram(
+    'vidconvertly_request_peak_memory_bytes',
+    'Traced heap growth at peak while handling a request (only while profiling)',
+    ['endpoint'],
+    buckets=(1024 ** 2, 10 * 1024 ** 2, 50 * 1024 ** 2, 100 * 1024 ** 2, 250 * 1024 ** 2,
+             500 * 1024 ** 2, 1024 ** 3, 2 * 1024 ** 3)
+)
+QUEUE_DEPTH = Gauge(
+    'vidconvertly_queue_depth',
+    'Work items waiting to be processed',
+    ['queue']
+)
+INFLIGHT_JOBS = Gauge(
+    'vidconvertly_inflight_jobs',
+    'Download jobs currently running',
+    ['platform', 'endpoint']
+)
+ADMISSION_INFLIGHT = Gauge(
+    'vidconvertly_admission_inflight',
+    'Jobs holding an admission slot',
+    ['lane']
+)
+ADMISSION_DECISIONS = Counter(
+    'vidconvertly_admission_decisions_total',
+    'Admission decisions by lane (admitted, queued, rejected)',
+    ['lane', 'decision']
+)
+ADMISSION_PRESSURE = Gauge(
+    'vidconvertly_admission_pressure',
+    'Load signals the admission controller sheds heavy work on',
+    ['signal']
+)
+EGRESS_ACTIVE_STREAMS = Gauge(
+    'vidconvertly_egress_active_streams',
+    'Response bodies currently being streamed through the egress scheduler'
+)
+EGRESS_THROTTLED_SECONDS = Counter(
+    'vidconvertly_egress_throttled_seconds_total',
+    'Time response streams spent paused by egress limits'
+)
+PREFETCHES = Counter(
+    'vidconvertly_prefetches_total',
+    'Speculative downloads by outcome (started, skipped, claimed, completed, cancelled, failed)',
+    ['outcome']
+)
+JOB_RECOVERIES = Counter(
+    'vidconvertly_job_recoveries_total',
+    'Persisted jobs taken over from a dead worker (resumed, failed) or joined by a repeated request (attached)',
+    ['outcome']
+)
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Expose metrics in the Prometheus text format."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def platform_label(info_dict) -> str:
+    """Derive a low-cardinality platform label from a yt-dlp info dict."""
+    extractor = (info_dict or {}).get('extractor_key') or 'generic'
+    return extractor.lower()
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup."""
+    CACHE_REQUESTS.labels(cache=cache, result='hit' if hit else 'miss').inc()
+
+
+@contextmanager
+def observe(histogram, **labels):
+    """Time the wrapped block into the given histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def track_job(platform: str, endpoint: str):
+    """Count the wrapped block as an in-flight job."""
+    gauge = INFLIGHT_JOBS.labels(platform=platform, endpoint=endpoint)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def observe_download_finished(d):
+    """Record throughput for a yt-dlp progress 'finished' event."""
+    platform = platform_label(d.get('info_dict'))
+    total_bytes = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+    elapsed = d.get('elapsed') or 0
+    if total_bytes:
+        DOWNLOADED_BYTES.labels(platform=platform).inc(total_bytes)
+    if total_bytes and elapsed > 0:
+        DOWNLOAD_THROUGHPUT.labels(platform=platform).observe(total_bytes / elapsed)
+
+
+class PostprocessorTimer:
+    """yt-dlp postprocessor hook that times each postprocessor run (merge, convert, ...)."""
+
+    def __init__(self):
+        self._started = {}
+
+    def __call__(self, d):
+        name = d.get('postprocessor', 'unknown')
+        if d['status'] == 'started':
+            self._started[name] = time.perf_counter()
+        elif d['status'] == 'finished' and name in self._started:
+            start = self._started.pop(name)
+            duration = time.perf_counter() - start
+            POSTPROCESS_DURATION.labels(
+                platform=platform_label(d.get('info_dict')),
+                postprocessor=name
+            ).observe(duration)
+            add_span(f"postprocess-{name}", start, duration)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and response send time."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        state = {'status': 500, 'send_start': None}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                state['status'] = message['status']
+                state['send_start'] = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The route template is only known once routing has happened, so
+            # unmatched paths are collapsed to keep label cardinality bounded.
+            route = scope.get('route')
+            endpoint = getattr(route, 'path', 'unmatched')
+            end = time.perf_counter()
+            REQUEST_DURATION.labels(
+                endpoint=endpoint,
+                method=scope['method'],
+                status=str(state['status'])
+            ).observe(end - start)
+            if state['send_start'] is not None:
+                RESPONSE_SEND_DURATION.labels(endpoint=endpoint).observe(end - state['send_start'])
@@ -0,0 +1,171 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+from fastapi.responses import JSONResponse
+
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+NEGATIVE_CACHE_MAX = int(os.environ.get("NEGATIVE_CACHE_MAX", 5000))
+# How long a failure is remembered, by error class. Removed videos rarely come
+# back; a private video may be made public, so it is retried sooner.
+NEGATIVE_TTLS = {
+    'unavailable': int(os.environ.get("NEGATIVE_TTL_UNAVAILABLE", 6 * 3600)),
+    'private': int(os.environ.get("NEGATIVE_TTL_PRIVATE", 1800)),
+    'geo': int(os.environ.get("NEGATIVE_TTL_GEO", 6 * 3600)),
+    'unsupported': int(os.environ.get("NEGATIVE_TTL_UNSUPPORTED", 24 * 3600)),
+}
+STATUS_CODES = {'unavailable': 404, 'private': 403, 'geo': 451, 'unsupported': 400}
+MESSAGES = {
+    'unavailable': "This video is unavailable or has been removed",
+    'private': "This video is private or requires signing in",
+    'geo': "This video is not available in the server's region",
+    'unsupported': "This URL is not a supported video page",
+}
+
+# Failures that say nothing about the video itself, or may pass on retry; never cached.
+_NOT_CACHED = re.compile(
+    r"try again later|too many requests|rate.?limit|not a bot|HTTP Error (?:403|429|5\d\d)|timed out|temporar"
+    r"|connection|network|requested format",
+    re.IGNORECASE
+)
+# Matched against yt-dlp's error messages, first match wins.
+_CLASSES = [
+    ('geo', re.compile(r"in your country|geo.?restrict|not available in your (?:region|location)", re.IGNORECASE)),
+    ('private', re.compile(
+        r"private video|video is private|sign in to confirm|login required|requires? (?:login|authentication)"
+        r"|members[- ]only|age.?restricted|registered users",
+        re.IGNORECASE
+    )),
+    ('unavailable', re.compile(
+        r"video unavailable|not available|no longer available|has been removed|been deleted|does not exist"
+        r"|account .*terminated|HTTP Error 404",
+        re.IGNORECASE
+    )),
+    ('unsupported', re.compile(r"unsupported url", re.IGNORECASE)),
+]
+
+_YOUTUBE_HOSTS = ('youtube.com', 'youtu.be', 'youtube-nocookie.com')
+_YOUTUBE_ID = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/|/v/)([\w-]{11})(?![\w-])")
+_HOST_PREFIXES = ('www.', 'm.', 'mobile.', 'web.')
+# Query parameters that only track where a link was shared from.
+_TRACKING_PARAMS = {'si', 'feature', 'igshid', 'igsh', 'fbclid', 'mibextid', 'is_from_webapp', 'sender_device', 't'}
+
+
+def video_key(url: str) -> str:
+    """Normalize a URL to one key per video, so share links and mobile URLs hit the same entry."""
+    parsed = urlparse(url if '//' in url else '//' + url)
+    host = (parsed.hostname or '').lower()
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    if any(host == h or host.endswith('.' + h) for h in _YOUTUBE_HOSTS):
+        match = _YOUTUBE_ID.search(url)
+        if match:
+            return f"youtube:{match.group(1)}"
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parsed.query) if k not in _TRACKING_PARAMS and not k.startswith('utm_')
+    ))
+    return f"{host}{parsed.path.rstrip('/')}" + (f"?{query}" if query else '')
+
+
+def classify(message: Optional[str]) -> Optional[str]:
+    """Error class of a permanent extraction failure, or None if it may succeed on retry."""
+    if not message or _NOT_CACHED.search(message):
+        return None
+    return next((kind for kind, pattern in _CLASSES if pattern.search(message)), None)
+
+
+class VideoUnavailable(Exception):
+    """Raised for a video that is known to fail extraction; `retry_after` is in seconds."""
+
+    def __init__(self, kind: str, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.kind = kind
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def unavailable_response(error: VideoUnavailable) -> JSONResponse:
+    return JSONResponse(
+        status_code=STATUS_CODES[error.kind],
+        content={"detail": MESSAGES[error.kind], "reason": error.kind},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+class ErrorRecorder:
+    """yt-dlp logger that remembers the last error it reported.
+
+    With `ignoreerrors` set yt-dlp only logs extraction errors and returns
+    None; this keeps the message so the failure can be classified.
+    """
+
+    def __init__(self, target: logging.Logger = logger):
+        self.target = target
+        self.last_error = None
+
+    def debug(self, msg):
+        self.target.debug(msg)
+
+    def info(self, msg):
+        self.target.info(msg)
+
+    def warning(self, msg):
+        self.target.warning(msg)
+
+    def error(self, msg):
+        self.last_error = msg
+        self.target.error(msg)
+
+
+class NegativeCache:
+    """Recently failed videos, so repeat requests are rejected without contacting the platform.
+
+    Only failures that retrying can't fix are kept (removed, private,
+    geo-blocked or unsupported), each for its class's TTL. Entries are per
+    worker, like the video info cache.
+    """
+
+    def __init__(self, max_entries: int = NEGATIVE_CACHE_MAX):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def check(self, url: str):
+        """Raise VideoUnavailable if `url` failed recently."""
+        key = video_key(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.time():
+                del self._entries[key]
+                entry = None
+        record_cache('negative', entry is not None)
+        if entry is not None:
+            kind, reason, expires = entry
+            raise VideoUnavailable(kind, reason, max(1, int(expires - time.time())))
+
+    def record(self, url: str, message: Optional[str]) -> Optional[VideoUnavailable]:
+        """Remember a failed extraction if it is permanent; returns the error to report, if so."""
+        kind = classify(message)
+        if kind is None:
+            return None
+        ttl = NEGATIVE_TTLS[kind]
+        key = video_key(url)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (kind, message, time.time() + ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+        logger.info(f"Caching {kind} failure for {key} for {ttl}s")
+        return VideoUnavailable(kind, message, ttl)
+
+
+negative_cache = NegativeCache()
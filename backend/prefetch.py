@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+from typing import Callable, Optional
+
+from admission import admission
+from cancellation import CancelToken
+from metrics import PREFETCHES
+from profiling import background_finished, background_started
+from results import StoredResult, results
+
+logger = logging.getLogger(__name__)
+
+# Speculative downloads are off unless explicitly enabled.
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "false").lower() in ("1", "true", "yes")
+PREFETCH_MAX_CONCURRENT = int(os.environ.get("PREFETCH_MAX_CONCURRENT", 2))
+# Budget for the expected size of all running prefetches together.
+PREFETCH_MAX_BYTES = int(os.environ.get("PREFETCH_MAX_BYTES", 1024 ** 3))
+# A prefetch nobody has asked for by then is cancelled.
+PREFETCH_UNUSED_SECONDS = int(os.environ.get("PREFETCH_UNUSED_SECONDS", 90))
+# The frontend lists 1080p first, and that is what most users pick.
+PREFETCH_QUALITY = int(os.environ.get("PREFETCH_QUALITY", 1080))
+
+
+class PrefetchJob:
+    def __init__(self, key: str, expected_bytes: int):
+        self.key = key
+        self.expected_bytes = expected_bytes
+        self.token = CancelToken()
+        self.future = None
+        self.timer = None
+        self.claimed = False
+
+
+class Prefetcher:
+    """Run likely downloads ahead of the request for them, within a budget.
+
+    A job is a blocking callable taking a CancelToken and returning the
+    StoredResult; it runs in the default executor and holds a download slot
+    while it does, without ever queueing for one. /api/download either finds
+    the finished result in the result store or claims the running job.
+    """
+
+    def __init__(self, enabled: bool = PREFETCH_ENABLED, max_concurrent: int = PREFETCH_MAX_CONCURRENT,
+                 max_bytes: int = PREFETCH_MAX_BYTES, unused_seconds: float = PREFETCH_UNUSED_SECONDS):
+        self.enabled = enabled
+        self.max_concurrent = max_concurrent
+        self.max_bytes = max_bytes
+        self.unused_seconds = unused_seconds
+        self.jobs = {}
+
+    @property
+    def reserved_bytes(self) -> int:
+        return sum(job.expected_bytes for job in self.jobs.values())
+
+    def schedule(self, key: str, expected_bytes: Optional[int],
+                 job_fn: Callable[[CancelToken], StoredResult]) -> bool:
+        """Start `job_fn` for `key` unless it is cached, already running or over budget."""
+        if not self.enabled or key in self.jobs or results.has(key):
+            return False
+        # Without a size estimate, assume the job takes an even share of the budget.
+        expected_bytes = expected_bytes or self.max_bytes // max(self.max_concurrent, 1)
+        if len(self.jobs) >= self.max_concurrent or self.reserved_bytes + expected_bytes > self.max_bytes:
+            PREFETCHES.labels(outcome='skipped').inc()
+            return False
+        if not admission.try_admit('download'):
+            PREFETCHES.labels(outcome='skipped').inc()
+            return False
+
+        loop = asyncio.get_event_loop()
+        job = PrefetchJob(key, expected_bytes)
+        self.jobs[key] = job
+        background_started()
+        job.future = loop.run_in_executor(None, job_fn, job.token)
+        job.future.add_done_callback(lambda future: self._finished(job, future))
+        job.timer = loop.call_later(self.unused_seconds, self._expire, job)
+        PREFETCHES.labels(outcome='started').inc()
+        logger.info(f"Prefetching {key[:12]} (expected {expected_bytes} bytes)")
+        return True
+
+    def _finished(self, job: PrefetchJob, future):
+        admission.release('download')
+        background_finished()
+        self.jobs.pop(job.key, None)
+        job.timer.cancel()
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or job.token.cancelled:
+            PREFETCHES.labels(outcome='cancelled').inc()
+        elif error is None:
+            PREFETCHES.labels(outcome='completed').inc()
+        else:
+            PREFETCHES.labels(outcome='failed').inc()
+            logger.info(f"Prefetch {job.key[:12]} failed: {str(error)}")
+
+    def _expire(self, job: PrefetchJob):
+        if not job.claimed and not job.future.done():
+            logger.info(f"Cancelling unused prefetch {job.key[:12]}")
+            job.token.cancel("prefetch unused")
+
+    async def claim(self, key: str) -> Optional[StoredResult]:
+        """Wait for a running prefetch of `key`; None if there is none or it fails."""
+        job = self.jobs.get(key)
+        if job is None or job.token.cancelled:
+            return None
+        job.claimed = True
+        PREFETCHES.labels(outcome='claimed').inc()
+        try:
+            # Shielded so a client disconnecting doesn't cancel the shared job.
+            return await asyncio.shield(job.future)
+        except Exception:
+            return None
+
+    def stop_all(self):
+        for job in self.jobs.values():
+            job.token.cancel("shutting down")
+
+
+prefetcher = Prefetcher()
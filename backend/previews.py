@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple
+
+from deps import ffmpeg
+from file_cache import KeyedLocks, run_pruner, temp_path, touch
+from metrics import FFMPEG_DURATION, observe, record_cache
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_CACHE_DIR = Path(os.environ.get(
+    "PREVIEW_CACHE_DIR", os.path.join(tempfile.gettempdir(), 'vidconvertly-previews')))
+PREVIEW_MAX_FRAMES = int(os.environ.get("PREVIEW_MAX_FRAMES", 20))
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get("PREVIEW_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+PREVIEW_COLUMNS = 5
+PREVIEW_TILE_WIDTHS = (120, 160, 240, 320)
+# Abort a stalled read from the platform instead of holding a worker (microseconds).
+PREVIEW_READ_TIMEOUT_US = 15 * 1000 * 1000
+
+_locks = KeyedLocks()
+
+
+def pick_stream_format(formats: list) -> Optional[dict]:
+    """Smallest progressive or video-only HTTP format that can be seeked directly."""
+    candidates = [
+        f for f in formats or []
+        if f.get('url')
+        and f.get('vcodec') != 'none'
+        and (f.get('protocol') or 'https') in ('http', 'https')
+    ]
+    if not candidates:
+        return None
+    # Anything from 240p up is plenty for tiles; below that, take the largest.
+    usable = [f for f in candidates if (f.get('height') or 0) >= 240]
+    if usable:
+        return min(usable, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0))
+    return max(candidates, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0))
+
+
+def frame_timestamps(duration: float, frames: int):
+    """Evenly spaced timestamps, skipping the very start and end of the video."""
+    step = duration / (frames + 1)
+    return [round(step * (i + 1), 3) for i in range(frames)]
+
+
+def sprite_layout(frames: int, tile_width: int) -> dict:
+    """Grid geometry of a sprite, so the client can slice it."""
+    columns = min(frames, PREVIEW_COLUMNS)
+    return {
+        'frames': frames,
+        'columns': columns,
+        'rows': math.ceil(frames / columns),
+        'tile_width': tile_width,
+        'tile_height': tile_width * 9 // 16,
+    }
+
+
+def _header_lines(headers: dict) -> str:
+    return ''.join(f"{key}: {value}\r\n" for key, value in (headers or {}).items())
+
+
+def _render_sprite(stream_format: dict, timestamps: list, tile_width: int, destination: Path):
+    layout = sprite_layout(len(timestamps), tile_width)
+    tile_height = layout['tile_height']
+    input_options = {
+        # Decode keyframes only and stop at the keyframe before each timestamp,
+        # so every input costs one seek and one frame rather than a full GOP.
+        'skip_frame': 'nokey',
+        'noaccurate_seek': None,
+        'rw_timeout': PREVIEW_READ_TIMEOUT_US,
+    }
+    headers = _header_lines(stream_format.get('http_headers'))
+    if headers:
+        input_options['headers'] = headers
+
+    tiles = []
+    for ts in timestamps:
+        tiles.append(
+            ffmpeg.input(stream_format['url'], ss=ts, **input_options)
+            .video
+            .trim(end_frame=1)
+            # Non-accurate seeks can leave the keyframe before zero; rebase it.
+            .setpts('PTS-STARTPTS')
+            .filter('scale', tile_width, tile_height, force_original_aspect_ratio='decrease')
+            .filter('pad', tile_width, tile_height, '(ow-iw)/2', '(oh-ih)/2')
+            .filter('setsar', 1)
+        )
+    tmp = temp_path(destination)
+    try:
+        with observe(FFMPEG_DURATION, operation='preview_sprite'):
+            (
+                ffmpeg.concat(*tiles, v=1, a=0)
+                .filter('tile', f"{layout['columns']}x{layout['rows']}")
+                .output(str(tmp), vframes=1, **{'q:v': 5})
+                .overwrite_output()
+                .run(quiet=True)
+            )
+        os.replace(tmp, destination)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+async def get_preview_sprite(video_id: str, info: dict, frames: int, tile_width: int) -> Tuple[Path, dict]:
+    """Return (path, layout) of a sprite of `frames` keyframes tiled in reading order.
+
+    Frames are pulled from the platform's stream URL with input seeking, so
+    only a few small ranges of the video are ever read.
+    """
+    frames = max(1, min(frames, PREVIEW_MAX_FRAMES))
+    tile_width = min(PREVIEW_TILE_WIDTHS, key=lambda w: abs(w - tile_width))
+    stem = hashlib.sha256(video_id.encode()).hexdigest()[:32]
+    sprite = PREVIEW_CACHE_DIR / f"{stem}_{frames}x{tile_width}.jpg"
+    layout = sprite_layout(frames, tile_width)
+    if sprite.exists():
+        record_cache('preview', True)
+        touch(sprite)
+        return sprite, layout
+
+    async with _locks.hold(video_id):
+        if sprite.exists():
+            record_cache('preview', True)
+            touch(sprite)
+            return sprite, layout
+        record_cache('preview', False)
+
+        try:
+            duration = float(info.get('duration') or 0)
+        except (TypeError, ValueError):
+            duration = 0
+        if duration <= 0:
+            raise ValueError("Video duration is unknown")
+        stream_format = pick_stream_format(info.get('formats'))
+        if stream_format is None:
+            raise ValueError("No seekable stream available")
+
+        PREVIEW_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            None, _render_sprite, stream_format, frame_timestamps(duration, frames), tile_width, sprite)
+    return sprite, layout
+
+
+async def run_cache_pruner():
+    """Keep the on-disk sprite cache under PREVIEW_CACHE_MAX_BYTES, least recently used first."""
+    await run_pruner(PREVIEW_CACHE_DIR, PREVIEW_CACHE_MAX_BYTES)
@@ -0,0 +1,203 @@
+import asyncio
+import collections
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from metrics import REQUEST_PEAK_MEMORY
+
+logger = logging.getLogger(__name__)
+
+# Profiling endpoints are disabled unless an admin token is configured.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+MAX_CPU_PROFILE_SECONDS = 120
+# Innermost Python frames of a thread parked with nothing to do: idle executor
+# workers, Event/Condition and queue waits, and an event loop waiting in select.
+IDLE_FRAMES = {
+    ('thread.py', '_worker'),
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+}
+
+# Per-request memory accounting is off by default; it only costs anything
+# while tracemalloc is tracing.
+request_memory_accounting = False
+# Frequent, tiny requests left out of memory accounting, so polling progress
+# during a download doesn't count as a concurrent request.
+UNTRACKED_PATHS = ('/api/progress/', '/api/download-progress/', '/healthz', '/metrics')
+
+# State of each accounted request in flight, and the number of downloads
+# running outside any request (prefetches, resumed jobs). One event loop
+# updates both, so no locking is needed.
+_in_flight = []
+_background_jobs = 0
+
+
+def _mark_overlapped():
+    for state in _in_flight:
+        state['overlapped'] = True
+
+
+def background_started():
+    """Note download work starting outside a request; it moves the process-wide peak too."""
+    global _background_jobs
+    _background_jobs += 1
+    _mark_overlapped()
+
+
+def background_finished():
+    global _background_jobs
+    _background_jobs = max(_background_jobs - 1, 0)
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+router = APIRouter(prefix="/admin/profile", dependencies=[Depends(require_admin)])
+
+
+@router.post("/memory/start")
+async def start_memory_tracing(frames: int = 10, per_request: bool = True):
+    """Start tracemalloc and optionally per-request peak memory accounting."""
+    global request_memory_accounting
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    request_memory_accounting = per_request
+    return {"tracing": True, "frames": tracemalloc.get_traceback_limit(), "per_request": per_request}
+
+
+@router.post("/memory/stop")
+async def stop_memory_tracing():
+    """Stop tracemalloc and drop its bookkeeping."""
+    global request_memory_accounting
+    request_memory_accounting = False
+    tracemalloc.stop()
+    return {"tracing": False}
+
+
+@router.get("/memory/snapshot", response_class=PlainTextResponse)
+async def memory_snapshot(limit: int = 25, group_by: str = "lineno"):
+    """Top allocation sites of the live heap."""
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="tracemalloc is not running")
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"current={current / 1024 ** 2:.1f}MiB peak={peak / 1024 ** 2:.1f}MiB"]
+    for stat in snapshot.statistics(group_by)[:limit]:
+        lines.append(str(stat))
+        if group_by == "traceback":
+            lines.extend(f"    {line}" for line in stat.traceback.format())
+    return "\n".join(lines)
+
+
+class StackSampler:
+    """Sample the stacks of all threads at a fixed interval.
+
+    This is a wall-clock profile: a thread blocked in network I/O or on an
+    ffmpeg subprocess is counted like one running Python code. Threads
+    parked with nothing to do (IDLE_FRAMES) are skipped unless
+    `include_idle` is set, so they don't dominate the output.
+
+    Output is in collapsed-stack format ("frame;frame;frame count"), which
+    flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, interval: float, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.counts = collections.Counter()
+        self._own_ident = None
+
+    def run(self, duration: float):
+        self._own_ident = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == self._own_ident:
+                    continue
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                if not self.include_idle and leaf in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.counts[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.counts.most_common())
+
+
+@router.get("/cpu", response_class=PlainTextResponse)
+async def cpu_profile(seconds: float = 10, interval_ms: float = 10, include_idle: bool = False):
+    """Sample the stacks of busy threads for a time window and return collapsed stacks (wall clock)."""
+    if not 0 < seconds <= MAX_CPU_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {MAX_CPU_PROFILE_SECONDS}]")
+    sampler = StackSampler(max(interval_ms, 1) / 1000, include_idle)
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, sampler.run, seconds)
+    return sampler.collapsed()
+
+
+class MemoryAccountingMiddleware:
+    """ASGI middleware logging traced memory growth, and peak, per request.
+
+    tracemalloc only tracks one process-wide peak, and resetting it for one
+    request erases another's. So the peak is only reset, and only reported,
+    for requests that ran with no other accounted request or background
+    download in flight; overlapping ones log just the memory they retained,
+    which concurrent work can skew either way. Polling routes
+    (UNTRACKED_PATHS) are passed through untouched, so a download polled
+    for progress still gets its peak.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or not request_memory_accounting or not tracemalloc.is_tracing()
+                or scope['path'].startswith(UNTRACKED_PATHS)):
+            await self.app(scope, receive, send)
+            return
+
+        state = {'overlapped': bool(_in_flight) or _background_jobs > 0}
+        _mark_overlapped()
+        _in_flight.append(state)
+        if not state['overlapped'] and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _in_flight.remove(state)
+            if tracemalloc.is_tracing():
+                after, peak = tracemalloc.get_traced_memory()
+                endpoint = getattr(scope.get('route'), 'path', 'unmatched')
+                retained = f"retained={(after - before) / 1024 ** 2:.1f}MiB"
+                if state['overlapped'] or not hasattr(tracemalloc, 'reset_peak'):
+                    logger.info(f"Memory for {scope['method']} {scope['path']}: {retained} (concurrent, no peak)")
+                else:
+                    REQUEST_PEAK_MEMORY.labels(endpoint=endpoint).observe(max(peak - before, 0))
+                    logger.info(
+                        f"Memory for {scope['method']} {scope['path']}: "
+                        f"peak={(peak - before) / 1024 ** 2:.1f}MiB {retained}"
+                    )
@@ -0,0 +1,38 @@
+from typing import Iterable, Optional, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serialized with orjson, several times faster than json.dumps.
+
+    Content is rendered as is, so handlers return plain dicts rather than
+    Pydantic models, which would be encoded field by field first. Falls back
+    to the standard encoder when orjson isn't installed.
+    """
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def parse_fields(fields: Union[str, Iterable[str], None]) -> Optional[set]:
+    """Field names from a comma-separated string or a list; None selects everything."""
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    return {f.strip() for f in fields if f and f.strip()} or None
+
+
+def select_fields(data: dict, fields: Optional[set]) -> dict:
+    """Keep only the requested top-level fields of a response payload."""
+    if fields is None:
+        return data
+    return {key: value for key, value in data.items() if key in fields}
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+
+from egress import client_key, egress
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Finished downloads are kept here so clients can resume, seek or re-request
+# them without the platform being hit again.
+RESULTS_ROOT = os.environ.get("RESULTS_ROOT", os.path.join(tempfile.gettempdir(), 'vidconvertly-results'))
+RESULT_TTL_SECONDS = int(os.environ.get("RESULT_TTL_SECONDS", 900))
+RESULT_MAX_BYTES = int(os.environ.get("RESULT_MAX_BYTES", 5 * 1024 ** 3))
+RESULT_PRUNE_INTERVAL = int(os.environ.get("RESULT_PRUNE_INTERVAL", 60))
+CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def result_key(*parts) -> str:
+    """Stable cache key for the inputs that determine a result file."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class StoredResult:
+    def __init__(self, download_id: str, directory: Path, meta: dict):
+        self.download_id = download_id
+        self.directory = directory
+        self.path = directory / 'result'
+        self.filename = meta['filename']
+        self.media_type = meta['media_type']
+        self.size = meta['size']
+        self.created = meta['created']
+        self.etag = f'"{download_id}-{self.size}"'
+
+
+class ResultStore:
+    """Finished result files shared by all workers through the filesystem.
+
+    Layout: <root>/<download id>/{result,meta.json} plus <root>/keys/<key>
+    holding the download id of the newest result for a cache key.
+    """
+
+    def __init__(self, root: str = RESULTS_ROOT, ttl: int = RESULT_TTL_SECONDS, max_bytes: int = RESULT_MAX_BYTES):
+        self.root = Path(root)
+        self.keys = self.root / 'keys'
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.keys.mkdir(parents=True, exist_ok=True)
+
+    def put(self, key: Optional[str], download_id: str, source: Path, filename: str,
+            media_type: str = 'video/mp4') -> StoredResult:
+        """Move a finished file into the store and index it under `key`."""
+        directory = self.root / download_id
+        directory.mkdir(parents=True, exist_ok=True)
+        # The source may live on tmpfs, so this can be a copy rather than a rename.
+        shutil.move(str(source), str(directory / 'result'))
+        meta = {
+            'key': key,
+            'filename': filename,
+            'media_type': media_type,
+            'size': (directory / 'result').stat().st_size,
+            'created': time.time()
+        }
+        self._write_atomic(directory / 'meta.json', json.dumps(meta))
+        if key:
+            self._write_atomic(self.keys / key, download_id)
+        return StoredResult(download_id, directory, meta)
+
+    def get(self, download_id: str) -> Optional[StoredResult]:
+        """Load a result by download id, or None if it is gone or expired."""
+        if not re.fullmatch(r'[\w-]+', download_id or ''):
+            return None
+        directory = self.root / download_id
+        try:
+            meta = json.loads((directory / 'meta.json').read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        result = StoredResult(download_id, directory, meta)
+        if time.time() - result.created > self.ttl or not result.path.exists():
+            return None
+        # The meta file's mtime doubles as the last-access time for eviction.
+        os.utime(directory / 'meta.json')
+        return result
+
+    def lookup(self, key: str) -> Optional[StoredResult]:
+        """Find the current result for a cache key."""
+        try:
+            download_id = (self.keys / key).read_text().strip()
+        except FileNotFoundError:
+            record_cache('result', False)
+            return None
+        result = self.get(download_id)
+        record_cache('result', result is not None)
+        return result
+
+    def has(self, key: str) -> bool:
+        """Whether a result is indexed under `key`, without counting it as a cache lookup."""
+        try:
+            download_id = (self.keys / key).read_text().strip()
+        except FileNotFoundError:
+            return False
+        return (self.root / download_id / 'meta.json').exists()
+
+    def prune(self) -> int:
+        """Drop expired results, then the least recently used ones over the size cap."""
+        now = time.time()
+        entries = []
+        removed = 0
+        for directory in self.root.iterdir():
+            if directory == self.keys or not directory.is_dir():
+                continue
+            try:
+                meta_path = directory / 'meta.json'
+                meta = json.loads(meta_path.read_text())
+                accessed = meta_path.stat().st_mtime
+            except (FileNotFoundError, ValueError):
+                # Half-written entry; only reclaim it once it is clearly abandoned.
+                if now - directory.stat().st_mtime > self.ttl:
+                    shutil.rmtree(directory, ignore_errors=True)
+                    removed += 1
+                continue
+            if now - meta['created'] > self.ttl:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+            else:
+                entries.append((accessed, meta['size'], directory))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, directory in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(directory, ignore_errors=True)
+            total -= size
+            removed += 1
+
+        for key_file in self.keys.iterdir():
+            try:
+                if not (self.root / key_file.read_text().strip()).exists():
+                    key_file.unlink()
+            except FileNotFoundError:
+                continue
+        return removed
+
+    async def run_pruner(self, interval: float = RESULT_PRUNE_INTERVAL):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                removed = await loop.run_in_executor(None, self.prune)
+                if removed:
+                    logger.info(f"Pruned {removed} retained results")
+            except Exception as e:
+                logger.error(f"Result pruning failed: {str(e)}")
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def _write_atomic(path: Path, content: str):
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(content)
+        os.replace(tmp, path)
+
+
+def parse_range(header: str, size: int):
+    """Parse a single-range "bytes=" header into (start, end) inclusive.
+
+    Returns None for headers we don't understand (the full body is sent) and
+    raises ValueError for ranges that can't be satisfied.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _iter_file(path: Path, start: int, length: int):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def safe_filename(filename: str, default: str = 'video.mp4') -> str:
+    """Reduce a client-supplied filename to a single path component."""
+    filename = (filename or '').replace('\\', '/').split('/')[-1]
+    filename = ''.join(c for c in filename if c.isprintable() and c not in '"<>:|?*').strip(' .')
+    return filename or default
+
+
+def content_disposition(filename: str) -> str:
+    """Attachment header with an ASCII fallback and the UTF-8 name per RFC 6266."""
+    ascii_name = filename.encode('ascii', 'ignore').decode('ascii') or 'video.mp4'
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def serve_result(request: Request, result: StoredResult) -> Response:
+    """Serve a stored result honouring Range, If-Range and If-None-Match."""
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': result.etag,
+        'Content-Disposition': content_disposition(result.filename),
+        'X-Download-Id': result.download_id,
+    }
+
+    if request.headers.get('if-none-match') == result.etag:
+        return Response(status_code=304, headers=headers)
+
+    size = result.size
+    start, end = 0, size - 1
+    status_code = 200
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if range_header and (if_range is None or if_range == result.etag):
+        try:
+            requested = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+        if requested is not None:
+            start, end = requested
+            status_code = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    length = end - start + 1
+    headers['Content-Length'] = str(length)
+    body = _iter_file(result.path, start, length)
+    if egress.enabled:
+        # Small files are prioritised by the size of the whole result, not of this range
+        body = egress.throttle(iterate_in_threadpool(body), client_key(request), result.size)
+    return StreamingResponse(
+        body,
+        status_code=status_code,
+        media_type=result.media_type,
+        headers=headers
+    )
+
+
+results = ResultStore()
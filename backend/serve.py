@@ -0,0 +1,141 @@
+"""Production launcher for the backend.
+
+Installs requirements only when requirements.txt changed since the last
+install into this environment, and serves through gunicorn's
+UvicornWorker so a restart drains in-flight downloads instead of cutting
+them off:
+
+    python serve.py                  # install if needed, then serve
+    python serve.py --install-only   # build step
+    python serve.py --no-install     # start step after a separate build
+
+Send SIGHUP to the pid in the pidfile for a graceful reload: new workers
+start, old ones finish their requests (up to DRAIN_SECONDS) and exit.
+SIGTERM drains the same way and then stops. Without gunicorn (e.g. on
+Windows) uvicorn's own process manager is used; it drains on SIGTERM but
+cannot reload.
+
+One worker is started unless WEB_CONCURRENCY or --workers asks for more.
+Several workers are only safe behind a proxy that pins each client to
+one worker. The video info cache (used by /api/thumbnail, /api/preview
+and /api/stream), the cancel registry, the Prometheus registry and the
+/admin/egress and /admin/profile settings all live in a single worker.
+"""
+import argparse
+import hashlib
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+REQUIREMENTS = BACKEND_DIR / 'requirements.txt'
+# Kept inside the environment, so a fresh virtualenv always gets a full install.
+INSTALL_STAMP = Path(sys.prefix) / '.vidconvertly-requirements.sha256'
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 8080))
+# How long a stopping worker may keep serving in-flight requests.
+DRAIN_SECONDS = int(os.environ.get("DRAIN_SECONDS", 300))
+PIDFILE = os.environ.get("SERVE_PIDFILE", os.path.join(tempfile.gettempdir(), 'vidconvertly-backend.pid'))
+
+
+def default_workers() -> int:
+    # Per-worker state (see the module docstring) isn't shared yet, so a request
+    # landing on another worker than the one before it would miss it. Downloads
+    # run in executor threads and ffmpeg subprocesses, so one worker still uses
+    # several CPUs. WEB_CONCURRENCY is the usual override.
+    return int(os.environ.get("WEB_CONCURRENCY") or 1)
+
+
+def requirements_digest() -> str:
+    digest = hashlib.sha256(REQUIREMENTS.read_bytes())
+    digest.update(sys.version.encode())
+    return digest.hexdigest()
+
+
+def install_requirements(force: bool = False) -> bool:
+    """pip install requirements.txt unless this environment already has exactly that file installed."""
+    digest = requirements_digest()
+    try:
+        installed = INSTALL_STAMP.read_text().strip()
+    except OSError:
+        installed = None
+    if installed == digest and not force:
+        print("Requirements unchanged, skipping install")
+        return False
+
+    subprocess.run([sys.executable, '-m', 'pip', 'install', '-r', str(REQUIREMENTS)], check=True)
+    try:
+        INSTALL_STAMP.write_text(digest)
+    except OSError as e:
+        print(f"Could not record installed requirements: {e}")
+    return True
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def serve(host: str, port: int, workers: int, drain_seconds: int, pidfile: str):
+    # uvicorn picks uvloop and httptools on its own ('auto') when they are installed.
+    loop = 'uvloop' if _available('uvloop') else 'asyncio'
+    http = 'httptools' if _available('httptools') else 'h11'
+    print(f"Serving on {host}:{port} with {workers} worker(s), {loop} loop, {http} parser", flush=True)
+
+    if _available('gunicorn') and os.name == 'posix':
+        argv = [
+            sys.executable, '-m', 'gunicorn', 'main:app',
+            '--worker-class', 'uvicorn.workers.UvicornWorker',
+            '--workers', str(workers),
+            '--bind', f'{host}:{port}',
+            '--graceful-timeout', str(drain_seconds),
+            '--keep-alive', '5',
+            '--pid', pidfile,
+            '--chdir', str(BACKEND_DIR),
+        ]
+        # Replace this process so the platform's SIGTERM reaches the gunicorn master directly.
+        os.execv(sys.executable, argv)
+
+    import uvicorn
+
+    os.chdir(BACKEND_DIR)
+    Path(pidfile).write_text(str(os.getpid()))
+    try:
+        uvicorn.run(
+            'main:app',
+            host=host,
+            port=port,
+            workers=workers,
+            timeout_graceful_shutdown=drain_seconds,
+        )
+    finally:
+        Path(pidfile).unlink(missing_ok=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Install dependencies if needed and serve the backend.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=default_workers(), help="defaults to WEB_CONCURRENCY or 1; see the module docstring before raising it")
+    parser.add_argument("--drain-seconds", type=int, default=DRAIN_SECONDS,
+                        help="how long stopping workers may finish in-flight requests")
+    parser.add_argument("--pidfile", default=PIDFILE)
+    install = parser.add_mutually_exclusive_group()
+    install.add_argument("--no-install", action="store_true", help="never run pip")
+    install.add_argument("--install-only", action="store_true", help="install requirements if changed and exit")
+    install.add_argument("--force-install", action="store_true", help="run pip even if requirements are unchanged")
+    args = parser.parse_args(argv)
+
+    if not args.no_install:
+        install_requirements(force=args.force_install)
+    if args.install_only:
+        return 0
+    serve(args.host, args.port, max(1, args.workers), args.drain_seconds, args.pidfile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
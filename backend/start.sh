@@ -1,3 +1,3 @@
 #!/bin/bash
-pip install -r requirements.txt
-uvicorn main:app --host 0.0.0.0 --port $PORT 
\ No newline at end of file
+cd "$(dirname "$0")"
+exec python serve.py "$@"
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+GB = 1024 ** 3
+
+
+def _env_bytes(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _default_tmpfs_root() -> Optional[str]:
+    return os.path.join('/dev/shm', 'vidconvertly') if os.path.isdir('/dev/shm') else None
+
+
+# Disk root for large jobs; small jobs go to tmpfs when one is available.
+SCRATCH_ROOT = os.environ.get("SCRATCH_ROOT", os.path.join(tempfile.gettempdir(), 'vidconvertly'))
+SCRATCH_TMPFS_ROOT = os.environ.get("SCRATCH_TMPFS_ROOT", _default_tmpfs_root())
+SCRATCH_TMPFS_MAX_BYTES = _env_bytes("SCRATCH_TMPFS_MAX_BYTES", 64 * MB)
+SCRATCH_JOB_QUOTA_BYTES = _env_bytes("SCRATCH_JOB_QUOTA_BYTES", 2 * GB)
+SCRATCH_GLOBAL_QUOTA_BYTES = _env_bytes("SCRATCH_GLOBAL_QUOTA_BYTES", 10 * GB)
+SCRATCH_MIN_FREE_BYTES = _env_bytes("SCRATCH_MIN_FREE_BYTES", 1 * GB)
+SCRATCH_ORPHAN_AGE_SECONDS = int(os.environ.get("SCRATCH_ORPHAN_AGE_SECONDS", 3600))
+SCRATCH_JANITOR_INTERVAL = int(os.environ.get("SCRATCH_JANITOR_INTERVAL", 300))
+
+# Present in job directories whose partial files another worker may resume;
+# the janitor leaves those alone until they are older than the orphan age.
+RESUMABLE_MARKER = '.resumable'
+
+
+class StorageFull(Exception):
+    """Raised when a job cannot be admitted without exceeding scratch limits."""
+
+
+def dir_size(path: Path) -> int:
+    """Total size in bytes of the files below `path`."""
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        total += dir_size(Path(entry.path))
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return total
+
+
+def _owner_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ScratchStorage:
+    """Per-job scratch directories with quotas, admission checks and a janitor.
+
+    Job directories are named "<pid>-<job id>" so that any worker can tell
+    whether the process owning a directory is still alive.
+
+    Each active directory reserves its expected size (the per-job quota when
+    that is unknown) until it is released or detached, and the global quota
+    applies to the sum of reservations rather than to what is already on
+    disk, so jobs admitted together can't overrun it. Reservations are kept
+    per worker process.
+    """
+
+    def __init__(self, disk_root: str = SCRATCH_ROOT, tmpfs_root: Optional[str] = SCRATCH_TMPFS_ROOT):
+        self.disk_root = Path(disk_root)
+        self.tmpfs_root = Path(tmpfs_root) if tmpfs_root else None
+        self.job_quota = SCRATCH_JOB_QUOTA_BYTES
+        self.global_quota = SCRATCH_GLOBAL_QUOTA_BYTES
+        self.min_free = SCRATCH_MIN_FREE_BYTES
+        self.tmpfs_max = SCRATCH_TMPFS_MAX_BYTES
+        # Active job directory -> bytes reserved for it
+        self.reservations = {}
+        self._lock = threading.Lock()
+
+    @property
+    def roots(self):
+        return [root for root in (self.disk_root, self.tmpfs_root) if root is not None]
+
+    def used_bytes(self) -> int:
+        return sum(dir_size(root) for root in self.roots)
+
+    @property
+    def reserved_bytes(self) -> int:
+        with self._lock:
+            return sum(self.reservations.values())
+
+    def _pick_root(self, expected_bytes: Optional[int]) -> Path:
+        if self.tmpfs_root is not None and expected_bytes is not None and expected_bytes <= self.tmpfs_max:
+            try:
+                self.tmpfs_root.mkdir(parents=True, exist_ok=True)
+                # Intermediate files (separate audio/video streams, the merged
+                # output) can take a few times the final size.
+                if shutil.disk_usage(self.tmpfs_root).free >= expected_bytes * 3:
+                    return self.tmpfs_root
+            except OSError as e:
+                logger.warning(f"tmpfs scratch root unavailable: {str(e)}")
+        return self.disk_root
+
+    def allocate(self, job_id: str, expected_bytes: Optional[int] = None) -> Path:
+        """Create a scratch directory for a job after checking the limits."""
+        if expected_bytes is not None and expected_bytes > self.job_quota:
+            raise StorageFull(f"Job needs {expected_bytes} bytes, over the per-job quota of {self.job_quota}")
+
+        reserve = expected_bytes or self.job_quota
+        root = self._pick_root(expected_bytes)
+        path = root / f"{os.getpid()}-{job_id}"
+        with self._lock:
+            if sum(self.reservations.values()) + reserve > self.global_quota:
+                raise StorageFull("Scratch storage quota exhausted")
+            self.reservations[path] = reserve
+        try:
+            root.mkdir(parents=True, exist_ok=True)
+            if shutil.disk_usage(root).free - (expected_bytes or 0) < self.min_free:
+                raise StorageFull(f"Not enough free space in {root}")
+            path.mkdir(parents=True, exist_ok=True)
+        except BaseException:
+            self._unreserve(path)
+            raise
+        return path
+
+    def _unreserve(self, path: Optional[Path]):
+        with self._lock:
+            self.reservations.pop(path, None)
+
+    def mark_resumable(self, path: Path):
+        (path / RESUMABLE_MARKER).touch()
+
+    def adopt(self, path: Path, job_id: str) -> Path:
+        """Take over a job directory left by another (dead) worker, keeping its files."""
+        target = path.parent / f"{os.getpid()}-{job_id}"
+        if target != path:
+            path.rename(target)
+        # Its files are already on disk, so the reservation is taken even over the quota
+        with self._lock:
+            self.reservations[target] = self.job_quota
+        return target
+
+    def detach(self, path: Optional[Path]):
+        """Stop tracking a job directory without deleting it, so it can be resumed later."""
+        self._unreserve(path)
+
+    def release(self, path: Optional[Path]):
+        """Delete a job's scratch directory."""
+        if path is None:
+            return
+        self._unreserve(path)
+        try:
+            shutil.rmtree(path, ignore_errors=False)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error cleaning up scratch directory {path}: {str(e)}")
+
+    @contextmanager
+    def job_dir(self, job_id: Optional[str] = None, expected_bytes: Optional[int] = None):
+        path = self.allocate(job_id or uuid.uuid4().hex, expected_bytes)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def reclaim_orphans(self, max_age: float = SCRATCH_ORPHAN_AGE_SECONDS) -> int:
+        """Remove directories whose owner died, and our own stale ones."""
+        reclaimed = 0
+        now = time.time()
+        own_pid = os.getpid()
+        with self._lock:
+            active = set(self.reservations)
+        for root in self.roots:
+            if not root.is_dir():
+                continue
+            for entry in root.iterdir():
+                if entry in active:
+                    continue
+                pid_part = entry.name.split('-', 1)[0]
+                owner = int(pid_part) if pid_part.isdigit() else None
+                try:
+                    age = now - entry.stat().st_mtime
+                    resumable = (entry / RESUMABLE_MARKER).exists()
+                    if resumable:
+                        age = now - (entry / RESUMABLE_MARKER).stat().st_mtime
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+                if resumable and age <= max_age:
+                    continue
+                dead_owner = owner is not None and owner != own_pid and not _owner_alive(owner)
+                stale = (owner is None or owner == own_pid) and age > max_age
+                if dead_owner or stale:
+                    if entry.is_dir():
+                        shutil.rmtree(entry, ignore_errors=True)
+                    else:
+                        entry.unlink(missing_ok=True)
+                    reclaimed += 1
+        if reclaimed:
+            logger.info(f"Scratch janitor reclaimed {reclaimed} orphaned entries")
+        return reclaimed
+
+    async def run_janitor(self, interval: float = SCRATCH_JANITOR_INTERVAL):
+        """Reclaim orphans now and then every `interval` seconds."""
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.reclaim_orphans)
+            except Exception as e:
+                logger.error(f"Scratch janitor failed: {str(e)}")
+            await asyncio.sleep(interval)
+
+
+scratch = ScratchStorage()
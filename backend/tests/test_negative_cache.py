@@ -0,0 +1,71 @@
+import pytest
+
+from negative_cache import classify, video_key
+
+# Messages as yt-dlp 2023.11.16 reports them through the logger.
+INSTAGRAM_LOGIN_HINT = (
+    "Use --cookies, --cookies-from-browser, --username and --password, --netrc-cmd, "
+    "or --netrc (instagram) to provide account credentials"
+)
+COOKIES_HINT = (
+    "Use --cookies-from-browser or --cookies for the authentication. See  "
+    "https://github.com/yt-dlp/yt-dlp/wiki/FAQ#how-do-i-pass-cookies-to-yt-dlp  for how to manually pass cookies"
+)
+
+
+@pytest.mark.parametrize("message", [
+    f"ERROR: [Instagram] CxYz12AbCdE: Requested content is not available, rate-limit reached or login required. "
+    f"{INSTAGRAM_LOGIN_HINT}",
+    "ERROR: [youtube] dQw4w9WgXcQ: You are rate-limited. Try again later.",
+    f"ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm you’re not a bot. This helps protect our community. "
+    f"{COOKIES_HINT}",
+    "ERROR: [youtube] dQw4w9WgXcQ: Unable to download API page: HTTP Error 429: Too Many Requests",
+    "ERROR: [generic] Unable to download webpage: HTTP Error 503: Service Unavailable",
+    "ERROR: [youtube] dQw4w9WgXcQ: Unable to download API page: <urlopen error [Errno -3] "
+    "Temporary failure in name resolution>",
+    "ERROR: [youtube] dQw4w9WgXcQ: Requested format is not available. Use --list-formats for a list of available formats",
+    "ERROR: Postprocessing: ffprobe and ffmpeg not found. Please install or provide the path using --ffmpeg-location",
+    f"WARNING: [youtube] Unable to extract yt initial data; {COOKIES_HINT}",
+    "",
+    None,
+])
+def test_transient_failures_are_not_cached(message):
+    assert classify(message) is None
+
+
+@pytest.mark.parametrize("message, kind", [
+    ("ERROR: [youtube] dQw4w9WgXcQ: Video unavailable", 'unavailable'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Video unavailable. This video has been removed by the uploader", 'unavailable'),
+    ("ERROR: [generic] Unable to download webpage: HTTP Error 404: Not Found (caused by <HTTPError 404: 'Not Found'>)",
+     'unavailable'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Private video. Sign in if you've been granted access to this video", 'private'),
+    (f"ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm your age. This video may be inappropriate for some users. "
+     f"{COOKIES_HINT}", 'private'),
+    (f"ERROR: [vimeo] 123456: This video is only available for registered users. {COOKIES_HINT}", 'private'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: The uploader has not made this video available in your country", 'geo'),
+    ("ERROR: Unsupported URL: https://example.com/page", 'unsupported'),
+])
+def test_permanent_failures_are_classified(message, kind):
+    assert classify(message) == kind
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ&feature=share",
+    "https://youtu.be/dQw4w9WgXcQ?si=AbCdEfGh",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+    "youtube.com/embed/dQw4w9WgXcQ",
+    "https://music.youtube.com/watch?v=dQw4w9WgXcQ&list=RDdQw4w9WgXcQ",
+])
+def test_youtube_urls_share_one_key(url):
+    assert video_key(url) == "youtube:dQw4w9WgXcQ"
+
+
+def test_tracking_parameters_and_host_prefixes_are_ignored():
+    assert video_key("https://www.instagram.com/p/CxYz12AbCdE/?igsh=abc&utm_source=ig_web") == \
+        video_key("instagram.com/p/CxYz12AbCdE")
+
+
+def test_distinct_videos_keep_distinct_keys():
+    assert video_key("https://vimeo.com/123456") != video_key("https://vimeo.com/654321")
+    assert video_key("https://example.com/watch?id=1") != video_key("https://example.com/watch?id=2")
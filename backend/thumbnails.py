@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Tuple
+
+from deps import aiohttp, ffmpeg
+from file_cache import KeyedLocks, run_pruner, temp_path, touch
+from metrics import FFMPEG_DURATION, observe, record_cache
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_CACHE_DIR = Path(os.environ.get(
+    "THUMBNAIL_CACHE_DIR", os.path.join(tempfile.gettempdir(), 'vidconvertly-thumbnails')))
+THUMBNAIL_MEMORY_ITEMS = int(os.environ.get("THUMBNAIL_MEMORY_ITEMS", 256))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get("THUMBNAIL_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+THUMBNAIL_MAX_SOURCE_BYTES = 10 * 1024 * 1024
+# Requested widths are snapped to these so the cache holds a few variants per video.
+THUMBNAIL_WIDTHS = (160, 320, 480, 640, 1280)
+
+_memory = OrderedDict()
+_locks = KeyedLocks()
+
+
+def snap_width(width: int) -> int:
+    """Closest supported thumbnail width."""
+    return min(THUMBNAIL_WIDTHS, key=lambda w: abs(w - width))
+
+
+def _cache_stem(video_id: str) -> str:
+    return hashlib.sha256(video_id.encode()).hexdigest()[:32]
+
+
+def _etag(data: bytes) -> str:
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def _remember(key: str, entry: Tuple[bytes, str]):
+    _memory[key] = entry
+    _memory.move_to_end(key)
+    while len(_memory) > THUMBNAIL_MEMORY_ITEMS:
+        _memory.popitem(last=False)
+
+
+async def _fetch_source(url: str, destination: Path):
+    timeout = aiohttp.ClientTimeout(total=20)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise ValueError(f"Thumbnail source returned HTTP {response.status}")
+            data = await response.content.read(THUMBNAIL_MAX_SOURCE_BYTES + 1)
+    if len(data) > THUMBNAIL_MAX_SOURCE_BYTES:
+        raise ValueError("Thumbnail source is too large")
+    tmp = temp_path(destination)
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, destination)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _resize(source: Path, destination: Path, width: int):
+    tmp = temp_path(destination)
+    try:
+        with observe(FFMPEG_DURATION, operation='thumbnail'):
+            (
+                ffmpeg.input(str(source))
+                .filter('scale', f'min(iw,{width})', -2)
+                .output(str(tmp), vframes=1, **{'q:v': 4})
+                .overwrite_output()
+                .run(quiet=True)
+            )
+        os.replace(tmp, destination)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+async def get_thumbnail(video_id: str, source_url: str, width: int) -> Tuple[bytes, str]:
+    """Return (jpeg bytes, etag) for a video thumbnail at one of the supported widths.
+
+    The platform image is fetched once per video; every width is derived from
+    that copy and cached on disk and in memory.
+    """
+    width = snap_width(width)
+    key = f"{video_id}:{width}"
+    if key in _memory:
+        _memory.move_to_end(key)
+        record_cache('thumbnail', True)
+        return _memory[key]
+
+    async with _locks.hold(video_id):
+        if key in _memory:
+            record_cache('thumbnail', True)
+            return _memory[key]
+
+        THUMBNAIL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        stem = _cache_stem(video_id)
+        resized = THUMBNAIL_CACHE_DIR / f"{stem}_{width}.jpg"
+        loop = asyncio.get_event_loop()
+        if resized.exists():
+            record_cache('thumbnail', True)
+            touch(resized)
+        else:
+            record_cache('thumbnail', False)
+            source = THUMBNAIL_CACHE_DIR / f"{stem}_source"
+            if source.exists():
+                touch(source)
+            else:
+                await _fetch_source(source_url, source)
+            await loop.run_in_executor(None, _resize, source, resized, width)
+
+        data = await loop.run_in_executor(None, resized.read_bytes)
+        entry = (data, _etag(data))
+        _remember(key, entry)
+    return entry
+
+
+async def run_cache_pruner():
+    """Keep the on-disk thumbnail cache under THUMBNAIL_CACHE_MAX_BYTES, least recently used first."""
+    await run_pruner(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES)
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger("trace")
+
+# Fraction of requests whose full trace is logged; slow requests are always logged.
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_SLOW_SECONDS = float(os.environ.get("TRACE_SLOW_SECONDS", "30"))
+
+
+class Trace:
+    """Spans recorded while handling a single request."""
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def add(self, name: str, start: float, duration: float):
+        self.spans.append((name, start - self.start, duration))
+
+    def server_timing(self) -> str:
+        """Render the spans as a Server-Timing header value, summing repeated stages."""
+        totals = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        totals['app'] = time.perf_counter() - self.start
+        return ', '.join(f"{name};dur={duration * 1000:.1f}" for name, duration in totals.items())
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'spans': [
+                {'name': name, 'start_ms': round(offset * 1000, 1), 'dur_ms': round(duration * 1000, 1)}
+                for name, offset, duration in self.spans
+            ]
+        }
+
+
+_current_trace = ContextVar("current_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def add_span(name: str, start: float, duration: float):
+    """Attach an already-measured span to the current request, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, start, duration)
+
+
+@contextmanager
+def span(name: str):
+    """Time the wrapped block as a named stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, start, time.perf_counter() - start)
+
+
+class TracingMiddleware:
+    """ASGI middleware emitting Server-Timing headers and sampled JSON trace logs."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _current_trace.set(trace)
+        state = {'status': 500, 'send_start': None}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                state['status'] = message['status']
+                state['send_start'] = time.perf_counter()
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', trace.server_timing().encode('latin-1')))
+                headers.append((b'timing-allow-origin', b'*'))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            end = time.perf_counter()
+            if state['send_start'] is not None:
+                trace.add('send', state['send_start'], end - state['send_start'])
+            total = end - trace.start
+            if total >= TRACE_SLOW_SECONDS or random.random() < TRACE_SAMPLE_RATE:
+                record = trace.to_dict()
+                record.update({
+                    'method': scope['method'],
+                    'path': scope['path'],
+                    'status': state['status'],
+                    'total_ms': round(total * 1000, 1)
+                })
+                logger.info(json.dumps(record))
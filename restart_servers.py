@@ -1,29 +1,7 @@
-import os
-import sys
 import time
-import subprocess
-import psutil
 import webbrowser
-from pathlib import Path
 
-def kill_process_on_port(port):
-    for proc in psutil.process_iter(['pid', 'name', 'connections']):
-        try:
-            for conn in proc.connections():
-                if conn.laddr.port == port:
-                    os.kill(proc.pid, 9)
-                    print(f"Killed process {proc.pid} using port {port}")
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass
-
-def kill_process_by_name(name):
-    for proc in psutil.process_iter(['pid', 'name']):
-        try:
-            if name.lower() in proc.info['name'].lower():
-                os.kill(proc.pid, 9)
-                print(f"Killed process {proc.pid} ({proc.info['name']})")
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass
+from server_tools import backend_healthy, prepare_backend, reload_backend, start_backend, start_frontend, stop_port
 
 def main():
     print("=" * 50)
@@ -31,61 +9,30 @@ def main():
     print("=" * 50)
     print()
 
-    # Step 1: Stop all existing servers
-    print("Step 1: Stopping all existing servers...")
-    kill_process_on_port(8000)
-    kill_process_on_port(8080)
-    kill_process_by_name("python")
-    kill_process_by_name("node")
-    time.sleep(2)
-    print("All existing servers stopped!")
-    print()
-
-    # Step 2: Start Backend Server
-    print("Step 2: Starting Backend Server...")
-    backend_dir = Path("backend")
-    venv_dir = backend_dir / ".venv"
-    
-    if not venv_dir.exists():
-        print("Creating virtual environment...")
-        subprocess.run([sys.executable, "-m", "venv", str(venv_dir)], check=True)
-    
-    # Install/update required packages
-    pip_cmd = str(venv_dir / "Scripts" / "pip.exe")
-    packages = ["fastapi", "uvicorn", "python-multipart", "yt-dlp", "requests", "python-dotenv", "aiohttp"]
-    print("Installing/updating required packages...")
-    subprocess.run([pip_cmd, "install", *packages], check=True)
-
-    # Start backend server
-    backend_script = str(venv_dir / "Scripts" / "uvicorn.exe")
-    backend_process = subprocess.Popen(
-        [backend_script, "main:app", "--reload", "--host", "0.0.0.0", "--port", "8000"],
-        cwd=str(backend_dir),
-        creationflags=subprocess.CREATE_NEW_CONSOLE
-    )
-
-    # Wait for backend to start
-    print("Waiting for backend to initialize...")
-    time.sleep(5)
-    
-    # Test backend connection
-    try:
-        import requests
-        response = requests.get("http://localhost:8000/docs")
-        if response.status_code == 200:
-            print("Backend server started successfully!")
-        else:
-            print("Warning: Backend server might not be running properly")
-    except:
+    # A gunicorn backend reloads in place: new workers start and the old ones
+    # finish their in-flight downloads before exiting
+    print("Step 1: Restarting Backend Server...")
+    backend_process = None
+    if reload_backend():
+        print("Backend reloaded without dropping connections!")
+    else:
+        # Only the servers on our ports are stopped, never other python or node processes
+        stop_port(8000)
+        prepare_backend()
+        backend_process = start_backend(8000)
+        print("Waiting for backend to initialize...")
+        time.sleep(5)
+
+    if backend_healthy(8000):
+        print("Backend server started successfully!")
+    else:
         print("Warning: Could not verify backend server status")
     print()
 
-    # Step 3: Start Frontend Server
-    print("Step 3: Starting Frontend Server...")
-    frontend_process = subprocess.Popen(
-        ["npm", "run", "dev"],
-        creationflags=subprocess.CREATE_NEW_CONSOLE
-    )
+    # Step 2: Restart Frontend Server
+    print("Step 2: Restarting Frontend Server...")
+    stop_port(8080)
+    frontend_process = start_frontend()
 
     print("\n" + "=" * 50)
     print("All Servers Restarted Successfully!")
@@ -105,10 +52,11 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         print("\nShutting down servers...")
-        backend_process.terminate()
+        stop_port(8000)
+        stop_port(8080)
+        if backend_process is not None:
+            backend_process.wait()
         frontend_process.terminate()
-        kill_process_on_port(8000)
-        kill_process_on_port(8080)
         print("All servers stopped!")
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import urllib.request
+from pathlib import Path
+
+import psutil
+
+BACKEND_DIR = Path("backend")
+VENV_DIR = BACKEND_DIR / ".venv"
+# Same default as backend/serve.py.
+BACKEND_PIDFILE = os.environ.get("SERVE_PIDFILE", os.path.join(tempfile.gettempdir(), 'vidconvertly-backend.pid'))
+# Give in-flight downloads this long to finish before a stopping server is killed.
+DRAIN_SECONDS = int(os.environ.get("DRAIN_SECONDS", 300))
+
+
+def venv_python(venv_dir=VENV_DIR) -> str:
+    if os.name == 'nt':
+        return str(venv_dir / "Scripts" / "python.exe")
+    return str(venv_dir / "bin" / "python")
+
+
+def console_kwargs() -> dict:
+    """Popen arguments opening a separate console on Windows.
+
+    Elsewhere output stays in this terminal, but the server gets its own
+    session so Ctrl+C here doesn't hit it directly; we stop it with SIGTERM,
+    which lets it drain.
+    """
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_CONSOLE}
+    return {'start_new_session': True}
+
+
+def prepare_backend():
+    """Create the virtualenv if needed and install requirements only if they changed."""
+    if not VENV_DIR.exists():
+        print("Creating virtual environment...")
+        subprocess.run([sys.executable, "-m", "venv", str(VENV_DIR)], check=True)
+    # Paths are relative to the backend directory once cwd is set there
+    subprocess.run([venv_python(Path(".venv")), "serve.py", "--install-only"], cwd=str(BACKEND_DIR), check=True)
+
+
+def start_backend(port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [venv_python(Path(".venv")), "serve.py", "--no-install", "--port", str(port)],
+        cwd=str(BACKEND_DIR),
+        **console_kwargs()
+    )
+
+
+def backend_healthy(port: int) -> bool:
+    try:
+        with urllib.request.urlopen(f"http://localhost:{port}/healthz", timeout=5) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def start_frontend() -> subprocess.Popen:
+    return subprocess.Popen(["npm", "run", "dev"], shell=os.name == 'nt', **console_kwargs())
+
+
+def _listeners(port: int):
+    found = {}
+    for conn in psutil.net_connections(kind='inet'):
+        if conn.laddr and conn.laddr.port == port and conn.status == psutil.CONN_LISTEN and conn.pid:
+            try:
+                found[conn.pid] = psutil.Process(conn.pid)
+            except psutil.NoSuchProcess:
+                pass
+    return list(found.values())
+
+
+def stop_port(port: int, timeout: float = DRAIN_SECONDS):
+    """Ask whatever listens on `port` to shut down, killing it only if it outlives `timeout`.
+
+    Only the listening processes (and their children) are touched, never
+    unrelated python or node processes.
+    """
+    listeners = _listeners(port)
+    pids = {proc.pid for proc in listeners}
+    processes = []
+    # Workers share their supervisor's socket; signal only the supervisor, which drains them
+    for proc in listeners:
+        try:
+            if proc.ppid() in pids:
+                continue
+            processes.append(proc)
+            processes.extend(proc.children(recursive=True))
+            proc.terminate()
+            print(f"Stopping process {proc.pid} on port {port}")
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+    for proc in alive:
+        try:
+            proc.kill()
+            print(f"Killed process {proc.pid} on port {port} after {timeout:.0f}s")
+        except psutil.NoSuchProcess:
+            pass
+
+
+def reload_backend() -> bool:
+    """Gracefully reload a running gunicorn backend (new workers start, old ones drain).
+
+    Returns False when there is no such backend, e.g. on Windows or when it
+    runs under plain uvicorn, which would exit on SIGHUP instead.
+    """
+    if not hasattr(signal, 'SIGHUP'):
+        return False
+    try:
+        proc = psutil.Process(int(Path(BACKEND_PIDFILE).read_text().strip()))
+        if not any('gunicorn' in part for part in proc.cmdline()):
+            return False
+        proc.send_signal(signal.SIGHUP)
+    except (OSError, ValueError, psutil.Error):
+        return False
+    print(f"Reloading backend (pid {proc.pid}); in-flight downloads finish on the old workers")
+    return True
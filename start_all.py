@@ -1,9 +1,7 @@
-import os
-import sys
 import time
-import subprocess
 import webbrowser
-from pathlib import Path
+
+from server_tools import prepare_backend, start_backend, start_frontend, stop_port
 
 def main():
     print("=" * 50)
@@ -13,26 +11,9 @@ def main():
 
     # Step 1: Start Backend Server
     print("Step 1: Starting Backend Server...")
-    backend_dir = Path("backend")
-    venv_dir = backend_dir / ".venv"
-    
-    if not venv_dir.exists():
-        print("Creating virtual environment...")
-        subprocess.run([sys.executable, "-m", "venv", str(venv_dir)], check=True)
-    
-    # Install/update required packages
-    pip_cmd = str(venv_dir / "Scripts" / "pip.exe")
-    packages = ["fastapi", "uvicorn", "python-multipart", "yt-dlp", "requests", "python-dotenv", "aiohttp"]
-    print("Installing/updating required packages...")
-    subprocess.run([pip_cmd, "install", *packages], check=True)
-
-    # Start backend server
-    backend_script = str(venv_dir / "Scripts" / "uvicorn.exe")
-    backend_process = subprocess.Popen(
-        [backend_script, "main:app", "--reload", "--host", "0.0.0.0", "--port", "8000"],
-        cwd=str(backend_dir),
-        creationflags=subprocess.CREATE_NEW_CONSOLE
-    )
+    # Requirements are only installed when they changed since the last start
+    prepare_backend()
+    backend_process = start_backend(8000)
 
     # Wait for backend to start
     print("Waiting for backend to initialize...")
@@ -42,10 +23,7 @@ def main():
 
     # Step 2: Start Frontend Server
     print("Step 2: Starting Frontend Server...")
-    frontend_process = subprocess.Popen(
-        ["npm", "run", "dev"],
-        creationflags=subprocess.CREATE_NEW_CONSOLE
-    )
+    frontend_process = start_frontend()
     print("Frontend server started!")
     print()
 
@@ -67,7 +45,8 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         print("\nShutting down servers...")
-        backend_process.terminate()
+        stop_port(8000)
+        backend_process.wait()
         frontend_process.terminate()
         print("All servers stopped!")
 
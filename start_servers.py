@@ -1,20 +1,8 @@
-import os
-import sys
 import time
-import subprocess
 import psutil
 import webbrowser
-from pathlib import Path
 
-def kill_process_on_port(port):
-    for proc in psutil.process_iter(['pid', 'name', 'connections']):
-        try:
-            for conn in proc.connections():
-                if conn.laddr.port == port:
-                    os.kill(proc.pid, 9)
-                    print(f"Killed process {proc.pid} using port {port}")
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass
+from server_tools import backend_healthy, prepare_backend, start_backend, start_frontend, stop_port
 
 def check_port(port):
     for proc in psutil.process_iter(['pid', 'name', 'connections']):
@@ -32,57 +20,32 @@ def main():
     print("=" * 50)
     print()
 
-    # Kill any existing processes on ports 8000 and 8080
+    # Stop any existing servers on ports 8000 and 8080
     print("Cleaning up existing processes...")
-    kill_process_on_port(8000)
-    kill_process_on_port(8080)
-    time.sleep(2)
+    stop_port(8000)
+    stop_port(8080)
 
-    # Setup backend environment
+    # Setup backend environment; requirements are only installed when they changed
     print("Setting up backend environment...")
-    backend_dir = Path("backend")
-    venv_dir = backend_dir / ".venv"
-    
-    if not venv_dir.exists():
-        print("Creating virtual environment...")
-        subprocess.run([sys.executable, "-m", "venv", str(venv_dir)], check=True)
-    
-    # Install/update required packages
-    pip_cmd = str(venv_dir / "Scripts" / "pip.exe")
-    packages = ["fastapi", "uvicorn", "python-multipart", "yt-dlp", "requests", "python-dotenv", "aiohttp"]
-    print("Installing/updating required packages...")
-    subprocess.run([pip_cmd, "install", *packages], check=True)
+    prepare_backend()
 
     # Start backend server
     print("Starting backend server...")
-    backend_script = str(venv_dir / "Scripts" / "uvicorn.exe")
-    backend_process = subprocess.Popen(
-        [backend_script, "main:app", "--reload", "--host", "0.0.0.0", "--port", "8000"],
-        cwd=str(backend_dir),
-        creationflags=subprocess.CREATE_NEW_CONSOLE
-    )
+    backend_process = start_backend(8000)
 
     # Wait for backend to start
     print("Waiting for backend to initialize...")
     time.sleep(5)
     
     # Test backend connection
-    try:
-        import requests
-        response = requests.get("http://localhost:8000/docs")
-        if response.status_code == 200:
-            print("Backend server started successfully!")
-        else:
-            print("Warning: Backend server might not be running properly")
-    except:
+    if backend_healthy(8000):
+        print("Backend server started successfully!")
+    else:
         print("Warning: Could not verify backend server status")
 
     # Start frontend server
     print("Starting frontend server...")
-    frontend_process = subprocess.Popen(
-        ["npm", "run", "dev"],
-        creationflags=subprocess.CREATE_NEW_CONSOLE
-    )
+    frontend_process = start_frontend()
 
     print("\n" + "=" * 50)
     print("All Servers Started Successfully!")
@@ -102,10 +65,10 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         print("\nShutting down servers...")
-        backend_process.terminate()
+        stop_port(8000)
+        stop_port(8080)
+        backend_process.wait()
         frontend_process.terminate()
-        kill_process_on_port(8000)
-        kill_process_on_port(8080)
         print("All servers stopped!")
 
 if __name__ == "__main__":